@@ -0,0 +1,193 @@
+"""
+/exif against the stub map server: how much of each image is downloaded and how often a map is fetched
+
+usage: python -m benchmarks.bench_exif [--requests 50] [--size 10485760] [--locations 5]
+every request streams a different JPEG from the stub's stand-in cdn, the photos are
+taken at a handful of places close together, so the map cache should answer most of them
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.getcwd())
+
+import httpx  # noqa: E402
+import main as bot  # noqa: E402
+from benchmarks import stub_maps  # noqa: E402
+from benchmarks.harness import FakeAttachment, FakeInteraction, log_in, percentile  # noqa: E402
+from utils import metrics  # noqa: E402
+from utils.exif import HeaderParser  # noqa: E402
+from utils.maps import StaticMaps  # noqa: E402
+
+COMMENT = "ctfbot benchmark ✓"
+
+
+def _ifd(entries, offset):
+    '''a little endian IFD at offset, (tag, type, count, payload) entries, long payloads placed after it'''
+    data_offset = offset + 2 + 12 * len(entries) + 4
+    head, tail = [struct.pack("<H", len(entries))], b""
+    for tag, field_type, count, payload in entries:
+        if len(payload) <= 4:
+            head.append(struct.pack("<HHI", tag, field_type, count) + payload.ljust(4, b"\x00"))
+        else:
+            head.append(struct.pack("<HHII", tag, field_type, count, data_offset + len(tail)))
+            tail += payload + b"\x00" * (len(payload) % 2)
+    return b"".join(head) + b"\x00\x00\x00\x00" + tail
+
+
+def _ascii(text):
+    data = text.encode() + b"\x00"
+    return (2, len(data), data)
+
+
+def _xp(text):
+    # what Windows writes: UTF-16 in a BYTE array
+    data = text.encode("utf-16-le") + b"\x00\x00"
+    return (1, len(data), data)
+
+
+def _rationals(*pairs):
+    return (5, len(pairs), b"".join(struct.pack("<II", num, den) for num, den in pairs))
+
+
+def _dms(degrees):
+    degrees = abs(degrees)
+    minutes = (degrees - int(degrees)) * 60
+    return _rationals((int(degrees), 1), (int(minutes), 1), (round((minutes - int(minutes)) * 6000), 100))
+
+
+def exif_tiff(lat, lon):
+    exif = [
+        (0x829A, *_rationals((1, 250))),
+        (0x829D, *_rationals((18, 10))),
+        (0x8827, 3, 1, struct.pack("<H", 100)),
+        (0x9003, *_ascii("2024:05:04 13:37:00")),
+        (0x9004, *_ascii("2024:05:04 13:37:00")),
+        (0x920A, *_rationals((42, 10))),
+        (0x9286, 7, 8 + len(COMMENT) * 2, b"UNICODE\x00" + COMMENT.encode("utf-16-le")),
+    ]
+    gps = [
+        (1, *_ascii("N" if lat >= 0 else "S")),
+        (2, *_dms(lat)),
+        (3, *_ascii("E" if lon >= 0 else "W")),
+        (4, *_dms(lon)),
+    ]
+    ifd0 = lambda exif_offset, gps_offset: [  # noqa: E731
+        (0x010F, *_ascii("Canon")),
+        (0x0110, *_ascii("Canon EOS 5D Mark IV")),
+        (0x8298, *_ascii("ctfbot benchmark")),
+        (0x9C9C, *_xp(COMMENT)),
+        (0x8769, 4, 1, struct.pack("<I", exif_offset)),
+        (0x8825, 4, 1, struct.pack("<I", gps_offset)),
+    ]
+    size = len(_ifd(ifd0(0, 0), 8))
+    exif_offset = 8 + size
+    exif_data = _ifd(exif, exif_offset)
+    gps_offset = exif_offset + len(exif_data)
+    return b"II*\x00" + struct.pack("<I", 8) + _ifd(ifd0(exif_offset, gps_offset), 8) + exif_data + _ifd(gps, gps_offset)
+
+
+def sample_jpeg(lat, lon, size, width=6720, height=4480):
+    '''a JPEG with EXIF (camera, exposure, GPS) and XMP headers and `size` bytes of "image data"'''
+    def segment(marker, data):
+        return bytes([0xFF, marker]) + struct.pack(">H", len(data) + 2) + data
+
+    xmp = b'http://ns.adobe.com/xap/1.0/\x00<x:xmpmeta><rdf:RDF><rdf:Description xmp:CreatorTool="Photoshop"/></rdf:RDF></x:xmpmeta>'
+    header = (
+        b"\xff\xd8"
+        + segment(0xE1, b"Exif\x00\x00" + exif_tiff(lat, lon))
+        + segment(0xE1, xmp)
+        + segment(0xE2, os.urandom(60000))  # stands in for an ICC profile, skipped without buffering
+        + segment(0xC0, struct.pack(">BHHB", 8, height, width, 3) + b"\x01\x22\x00\x02\x11\x01\x03\x11\x01")
+        + segment(0xDA, b"\x03\x01\x00\x02\x11\x03\x11\x00\x3f\x00")
+    )
+    return header + os.urandom(max(size - len(header) - 2, 0)) + b"\xff\xd9"
+
+
+def locations(count):
+    '''count places a few metres apart, so rounding puts several of them on the same map'''
+    return [(51.5007 + i * 0.00002, -0.1246 + i * 0.00002) for i in range(count)]
+
+
+def bench_parser(data, rounds=200):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        parser = HeaderParser()
+        for offset in range(0, len(data), 64 * 1024):
+            if parser.feed(data[offset:offset + 64 * 1024]):
+                break
+        parser.close()
+    elapsed = (time.perf_counter() - start) / rounds
+    print(f"parser: {elapsed * 1000:.2f} ms per image, read {parser.bytes_read} of {len(data)} bytes, {len(parser.fields)} fields")
+    for name in ("XP Comment", "User Comment", "GPS Position", "Image Size"):
+        assert parser.fields.get(name), f"parser lost {name}: {parser.fields}"
+    assert parser.fields["XP Comment"] == parser.fields["User Comment"] == COMMENT
+
+    exiftool = shutil.which("exiftool")
+    if exiftool:
+        with tempfile.NamedTemporaryFile(suffix=".jpg") as f:
+            f.write(data)
+            f.flush()
+            start = time.perf_counter()
+            for _ in range(10):
+                subprocess.run([exiftool, f.name], capture_output=True, check=True)
+            print(f"exiftool: {(time.perf_counter() - start) / 10 * 1000:.2f} ms per image (for comparison)")
+
+
+async def bench_handler(args):
+    runner, url = await stub_maps.start(latency=args.map_latency)
+    app = runner.app
+    log_in(bot.client)
+    bot.http = httpx.AsyncClient(timeout=30)
+    bot.static_maps = StaticMaps(bot.http, api_key="stub", url=f"{url}/v1/staticmap", directory=tempfile.mkdtemp(prefix="ctfbot-maps-"))
+
+    places = locations(args.locations)
+    attachments = []
+    for i in range(args.requests):
+        name = f"photo{i}.jpg"
+        app["files"][name] = sample_jpeg(*places[i % len(places)], args.size)
+        attachments.append(FakeAttachment(name, b"", size=args.size, url=f"{url}/attachments/{name}"))
+
+    latencies = []
+
+    async def one(index, attachment):
+        interaction = FakeInteraction(user=index)
+        start = time.perf_counter()
+        await bot.exif.callback(interaction, file=attachment)
+        latencies.append(time.perf_counter() - start)
+        return interaction
+
+    ingested = metrics.INGESTED_BYTES.value()
+    start = time.perf_counter()
+    interactions = await asyncio.gather(*(one(i, attachment) for i, attachment in enumerate(attachments)))
+    elapsed = time.perf_counter() - start
+
+    maps = sum(1 for interaction in interactions for message in interaction.sent if message.get("file"))
+    errors = sum("error occurred" in (message.get("content") or "") for interaction in interactions for message in interaction.sent)
+    print(f"{args.requests} x /exif on {args.size / 1024 / 1024:.0f} MiB JPEGs at {args.locations} places: {args.requests / elapsed:.1f} req/s, {errors} errors")
+    print(f"  latency p50 {percentile(latencies, 0.5) * 1000:.1f} ms, p95 {percentile(latencies, 0.95) * 1000:.1f} ms")
+    print(f"  downloaded {(metrics.INGESTED_BYTES.value() - ingested) / args.requests / 1024:.0f} KiB per image, "
+          f"the stub sent {sum(app['sent'].values()) / args.requests / 1024:.0f} KiB per image (socket buffers included)")
+    print(f"  {maps} replies with a map, {app['maps']} map requests to the stub, "
+          f"cache {({result: int(metrics.MAP_TILES.total(result=result)) for result in ('hit', 'shared', 'fetched', 'error')})}")
+
+    await bot.http.aclose()
+    await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--size", type=int, default=10 * 1024 * 1024)
+    parser.add_argument("--locations", type=int, default=5)
+    parser.add_argument("--map-latency", type=float, default=0.2)
+    args = parser.parse_args()
+    bench_parser(sample_jpeg(*locations(1)[0], args.size))
+    asyncio.run(bench_handler(args))
@@ -0,0 +1,61 @@
+"""
+cold start (one floss process per job) vs the warm worker pool in utils.floss_pool
+
+usage: python -m benchmarks.bench_floss sample [-n 4] [--rounds 10] [--binary ./tools/floss]
+without a binary the cold side runs floss from the current interpreter, which is
+what a worker does too, so the difference is purely startup and import time
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+from utils.floss_pool import FlossPool
+from utils.scheduler import run_tool
+
+COLD_START = "import sys, floss.main; sys.exit(floss.main.main(sys.argv[1:]))"
+
+
+def summary(label, timings):
+    timings = sorted(timings)
+    print(f"{label:<6} p50 {timings[len(timings) // 2] * 1000:8.1f} ms   "
+          f"max {timings[-1] * 1000:8.1f} ms   total {sum(timings):6.2f} s")
+
+
+async def main(args):
+    cold_command = [args.binary] if os.path.exists(args.binary) else [sys.executable, "-c", COLD_START]
+
+    cold, expected = [], None
+    for _ in range(args.rounds):
+        start = time.perf_counter()
+        expected = (await run_tool(*cold_command, "-n", str(args.limit), args.sample)).stdout
+        cold.append(time.perf_counter() - start)
+
+    pool = FlossPool(size=1, binary=args.binary)
+    start = time.perf_counter()
+    await pool.start()
+    print(f"pool warm-up {time.perf_counter() - start:.2f} s, {pool.workers()} worker(s)")
+    if not pool.available:
+        print("floss isn't importable here, the pool would fall back to one-shot runs")
+
+    warm, output = [], None
+    for _ in range(args.rounds):
+        start = time.perf_counter()
+        output = (await pool.run(args.sample, args.limit)).stdout
+        warm.append(time.perf_counter() - start)
+    await pool.close()
+
+    summary("cold", cold)
+    summary("warm", warm)
+    print(f"speedup {sorted(cold)[len(cold) // 2] / sorted(warm)[len(warm) // 2]:.1f}x, "
+          f"output {'matches' if output.strip() == expected.strip() else 'MISMATCH'}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("sample")
+    parser.add_argument("-n", "--limit", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--binary", default="./tools/floss")
+    asyncio.run(main(parser.parse_args()))
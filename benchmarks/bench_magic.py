@@ -0,0 +1,154 @@
+"""
+accuracy and latency of utils.magic against a generated corpus of real file formats
+
+usage: python -m benchmarks.bench_magic [dir ...]
+extra directories are scanned too and every file is printed with what it was identified as
+"""
+import bz2
+import gzip
+import io
+import lzma
+import os
+import pickle
+import sqlite3
+import struct
+import sys
+import tarfile
+import tempfile
+import time
+import wave
+import zipfile
+import zlib
+
+from utils.magic import identify
+
+ROUNDS = 2000
+
+
+def png():
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", 1, 1, 8, 0, 0, 0, 0)) + \
+        chunk(b"IDAT", zlib.compress(b"\x00\x00")) + chunk(b"IEND", b"")
+
+
+def zip_with(first_name, data=b"x"):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as z:
+        z.writestr(first_name, data)
+    return buf.getvalue()
+
+
+def tar():
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w", format=tarfile.USTAR_FORMAT) as t:
+        info = tarfile.TarInfo("flag.txt")
+        info.size = 5
+        t.addfile(info, io.BytesIO(b"flag\n"))
+    return buf.getvalue()
+
+
+def wav():
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(8000)
+        w.writeframes(b"\x00\x00" * 100)
+    return buf.getvalue()
+
+
+def sqlite():
+    path = tempfile.mktemp(suffix=".db")
+    con = sqlite3.connect(path)
+    con.execute("create table flags (flag text)")
+    con.commit()
+    con.close()
+    with open(path, "rb") as f:
+        data = f.read()
+    os.remove(path)
+    return data
+
+
+def iso():
+    data = bytearray(0x8800)
+    data[0x8000:0x8006] = b"\x01CD001"
+    return bytes(data)
+
+
+def pe():
+    data = bytearray(0x200)
+    data[0:2] = b"MZ"
+    struct.pack_into("<I", data, 0x3C, 0x80)
+    data[0x80:0x84] = b"PE\x00\x00"
+    data[0x98:0x9A] = b"\x0b\x02"
+    return bytes(data)
+
+
+def corpus():
+    '''(expected substring, data) pairs'''
+    with open(os.path.realpath(sys.executable), "rb") as f:
+        elf = f.read(4096)
+    return [
+        ("PNG", png()),
+        ("JPEG", b"\xff\xd8\xff\xe0\x00\x10JFIF\x00" + bytes(100)),
+        ("GIF", b"GIF89a" + bytes(20)),
+        ("BMP", b"BM" + struct.pack("<I", 70) + bytes(64)),
+        ("ZIP", zip_with("flag.txt")),
+        ("Office Open XML", zip_with("[Content_Types].xml")),
+        ("JAR", zip_with("META-INF/MANIFEST.MF")),
+        ("EPUB", zip_with("mimetype", b"application/epub+zip")),
+        ("tar", tar()),
+        ("gzip", gzip.compress(b"flag")),
+        ("bzip2", bz2.compress(b"flag")),
+        ("xz", lzma.compress(b"flag")),
+        ("WAV", wav()),
+        ("SQLite", sqlite()),
+        ("ISO 9660", iso()),
+        ("ELF", elf),
+        ("PE32+", pe()),
+        ("PDF", b"%PDF-1.7\n" + bytes(50)),
+        ("pcap", struct.pack("<IHHiIII", 0xA1B2C3D4, 2, 4, 0, 0, 65535, 1)),
+        ("pcapng", b"\x0a\x0d\x0d\x0a" + bytes(28)),
+        ("7-Zip", b"7z\xbc\xaf\x27\x1c\x00\x04" + bytes(24)),
+        ("RAR", b"Rar!\x1a\x07\x01\x00" + bytes(24)),
+        ("pickle", pickle.dumps({"flag": 1}, protocol=4)),
+        ("XML", b"<?xml version=\"1.0\"?><a/>"),
+        ("shebang", b"#!/bin/sh\necho hi\n"),
+        ("WebAssembly", b"\x00asm\x01\x00\x00\x00"),
+        ("OLE2", b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1" + bytes(504)),
+    ]
+
+
+def main(dirs):
+    samples = corpus()
+    correct = 0
+    for expected, data in samples:
+        name, candidates = identify(memoryview(data))
+        ok = name is not None and expected.lower() in name.lower()
+        correct += ok
+        print(f"  {'ok ' if ok else 'BAD'} {expected:<18} -> {name or 'unknown'}{'' if name else f' {candidates}'}")
+    print(f"accuracy: {correct}/{len(samples)} ({100 * correct / len(samples):.1f}%)")
+
+    timings = []
+    views = [memoryview(data) for _, data in samples]
+    for _ in range(ROUNDS // len(views) + 1):
+        for view in views:
+            start = time.perf_counter()
+            identify(view)
+            timings.append((time.perf_counter() - start) * 1e6)
+    timings.sort()
+    print(f"latency over {len(timings)} lookups: p50 {timings[len(timings) // 2]:.1f} us, "
+          f"p99 {timings[int(len(timings) * 0.99)]:.1f} us, max {timings[-1]:.1f} us")
+
+    for directory in dirs:
+        for root, _, files in os.walk(directory):
+            for file in files:
+                path = os.path.join(root, file)
+                with open(path, "rb") as f:
+                    name, candidates = identify(f.read(65536))
+                print(f"  {path}: {name or f'unknown {candidates}'}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
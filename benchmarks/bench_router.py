@@ -0,0 +1,87 @@
+"""
+runs utils.router against the stub openrouter server with injected latency and failures
+
+usage: python -m benchmarks.bench_router [--requests 30] [--stream]
+each scenario prints which models answered, the latency percentiles and the router state
+"""
+import argparse
+import asyncio
+import time
+from collections import Counter
+
+from benchmarks import stub_openrouter
+from utils.llm import LLMClient
+from utils.router import ModelRouter
+
+PRIMARY = "stub/primary"
+BACKUP = "stub/backup"
+MODELS = [
+    {"name": "Primary", "id": PRIMARY, "fallbacks": [BACKUP]},
+    {"name": "Backup", "id": BACKUP, "fallbacks": [PRIMARY]},
+]
+MESSAGES = [{"role": "user", "content": "what is a format string bug"}]
+
+# name, fault settings for the stub
+SCENARIOS = [
+    ("healthy", {"model_latency": {PRIMARY: 0.05, BACKUP: 0.05}}),
+    ("primary has a slow tail", {"model_latency": {PRIMARY: 0.05, BACKUP: 0.05}, "slow_every": 5, "slow": 1.5}),
+    ("primary down", {"model_latency": {PRIMARY: 0.05, BACKUP: 0.05}, "fail_models": {PRIMARY}}),
+    ("primary returns empty choices", {"model_latency": {PRIMARY: 0.05, BACKUP: 0.05}, "empty_rate": {PRIMARY: 0.5}}),
+]
+
+
+async def ask(router, stream):
+    if stream:
+        used, deltas = await router.stream(PRIMARY, MESSAGES)
+        async for _ in deltas:
+            pass
+        return used
+    _, used = await router.complete(PRIMARY, MESSAGES)
+    return used
+
+
+async def scenario(name, faults, requests, stream):
+    app_runner, base_url = await stub_openrouter.start()
+    app = app_runner.app
+    app["faults"]["model_latency"] = faults["model_latency"]
+    app["faults"]["fail_models"] = faults.get("fail_models", set())
+
+    llm = LLMClient("stub", base_url=base_url, max_retries=0)
+    await llm.start()
+    router = ModelRouter(llm, MODELS, min_samples=5, min_hedge_delay=0.05, default_hedge_delay=0.5, cooldown=2)
+
+    answered, latencies, errors = Counter(), [], 0
+    for i in range(requests):
+        # the slow tail and empty answers only hit the primary
+        slow = faults.get("slow_every") and i % faults["slow_every"] == faults["slow_every"] - 1
+        app["faults"]["model_latency"][PRIMARY] = faults["slow"] if slow else 0.05
+        app["faults"]["empty_rate"] = faults.get("empty_rate", 0.0)
+        start = time.perf_counter()
+        try:
+            answered[await ask(router, stream)] += 1
+        except Exception as e:
+            errors += 1
+            print(f"    error: {e}")
+        latencies.append(time.perf_counter() - start)
+
+    await llm.close()
+    await app_runner.cleanup()
+
+    latencies.sort()
+    print(f"{name}")
+    print(f"  answered by {dict(answered)}, {errors} errors, upstream requests {app['models']}")
+    print(f"  latency p50 {latencies[len(latencies) // 2] * 1000:.0f} ms, p95 {latencies[int(len(latencies) * 0.95)] * 1000:.0f} ms, max {latencies[-1] * 1000:.0f} ms")
+    for model, (p95, error_rate, is_open) in router.snapshot().items():
+        print(f"  {model}: p95 {p95 and round(p95 * 1000)} ms, errors {error_rate:.0%}{', circuit open' if is_open else ''}")
+
+
+async def main(args):
+    for name, faults in SCENARIOS:
+        await scenario(name, faults, args.requests, args.stream)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=30)
+    parser.add_argument("--stream", action="store_true")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,40 @@
+"""
+how long a fresh process takes to get through main.py's imports and setup, the part of time to ready that doesn't depend on discord
+
+usage: python -m benchmarks.bench_startup [--runs 10]
+the rest (gateway connect, command sync) is printed by the bot itself on ready and
+exported as ctfbot_startup_seconds. openai's import time is shown for comparison,
+main.py only pays it in the background after it is ready
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SNIPPETS = {
+    "main.py imports and setup": "import main; print(main.startup_times['imports'])",
+    "import openai": "import time; start = time.perf_counter(); import openai; print(time.perf_counter() - start)",
+}
+
+
+def measure(code, runs):
+    inside, wall = [], []
+    for _ in range(runs):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+        wall.append(time.perf_counter() - start)
+        inside.append(float(output.split()[-1]))
+    return statistics.median(inside), statistics.median(wall)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+    for name, code in SNIPPETS.items():
+        inside, wall = measure(code, args.runs)
+        print(f"{name:<26} {inside * 1000:7.0f} ms  (whole process {wall * 1000:.0f} ms, median of {args.runs})")
@@ -0,0 +1,130 @@
+"""
+compares the old `strings` subprocess path against utils.strings on large binaries
+
+usage: python -m benchmarks.bench_strings [file ...]
+with no files it benchmarks the python interpreter (ELF) and a synthetic multi-MB PE.
+utils.strings runs in a thread and in a worker process (what the bot does by default),
+with the event loop lag each causes: re holds the GIL while it scans, so the thread
+blocks the loop for about as long as the scan takes. when the limit isn't reached early
+the regex scan is slower than gnu strings, the subprocess is kept as the reference
+"""
+import asyncio
+import os
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.harness import measure_lag, percentile
+from utils import workers
+from utils.strings import CHUNK_SIZE, extract_strings, extract_strings_async, extract_strings_file
+
+RUNS = 5
+LIMITS = (4, 16, 50)
+
+
+def make_pe(path, size=8 << 20):
+    '''writes a fake PE: MZ/PE headers, random code-ish bytes and sparse ascii + utf-16 strings'''
+    rnd = random_bytes(size)
+    buf = bytearray(rnd)
+    buf[0:2] = b"MZ"
+    struct.pack_into("<I", buf, 0x3C, 0x80)
+    buf[0x80:0x84] = b"PE\x00\x00"
+    for i, off in enumerate(range(0x1000, size - 64, 64 * 1024)):
+        text = f"kernel32.dll!CreateFileW_{i:06d}"
+        buf[off:off + len(text)] = text.encode()
+        wide = text.encode("utf-16-le")
+        buf[off + 40:off + 40 + len(wide)] = wide[:min(len(wide), 24)]
+    with open(path, "wb") as f:
+        f.write(buf)
+
+
+def random_bytes(size):
+    # mostly non-printable so the scanner has to walk real distances between hits
+    data = bytearray(os.urandom(size))
+    for i in range(0, size, 3):
+        data[i] = data[i] & 0x1F
+    return bytes(data)
+
+
+def check_boundaries():
+    '''strings straddling a scan window have to come out whole, from memory and from a mapped file'''
+    for encoding, codec in (("ascii", "ascii"), ("utf-16le", "utf-16-le"), ("utf-16be", "utf-16-be")):
+        for shift in range(-9, 3):
+            data = b"\x01" * (CHUNK_SIZE + shift) + "abcdefgh".encode(codec) + b"\x01" * 16
+            assert extract_strings(data, encoding=encoding) == ["abcdefgh"], (encoding, shift)
+            with tempfile.NamedTemporaryFile() as f:
+                f.write(data)
+                f.flush()
+                assert extract_strings_file(f.name, encoding=encoding) == ["abcdefgh"], (encoding, shift)
+    print("window boundaries ok")
+
+
+async def run_subprocess(path, limit):
+    process = await asyncio.create_subprocess_exec(
+        "strings", "-n", str(limit), path,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=subprocess.DEVNULL
+    )
+    result, _ = await process.communicate()
+    return "\n".join(result.decode().split("\n")[:limit])
+
+
+async def run_thread(path, limit):
+    with open(path, "rb") as f:
+        data = f.read()
+    result = await extract_strings_async(data, min_len=limit, limit=limit)
+    return "\n".join(result)
+
+
+async def run_process(path, limit):
+    return "\n".join(await workers.run(extract_strings_file, path, limit, limit))
+
+
+async def timed(fn, path, limit):
+    '''median milliseconds and the p99 event loop lag while fn ran, in milliseconds'''
+    samples, lag = [], []
+    out = None
+    stop = asyncio.Event()
+    watcher = asyncio.create_task(measure_lag(stop, lag, interval=0.001))
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        out = await fn(path, limit)
+        samples.append((time.perf_counter() - start) * 1000)
+    stop.set()
+    await watcher
+    samples.sort()
+    return samples[len(samples) // 2], (percentile(lag, 0.99) or 0) * 1000, out
+
+
+async def main(paths):
+    for path in paths:
+        size = os.path.getsize(path)
+        print(f"{os.path.basename(path)} ({size / (1 << 20):.1f} MiB)")
+        for limit in LIMITS:
+            sub_ms, _, sub_out = await timed(run_subprocess, path, limit)
+            thread_ms, thread_lag, thread_out = await timed(run_thread, path, limit)
+            process_ms, process_lag, process_out = await timed(run_process, path, limit)
+            # the subprocess path leaves a trailing empty line when it finds fewer than `limit`
+            match = "ok" if sub_out.rstrip("\n") == thread_out == process_out else "MISMATCH"
+            print(f"  -n {limit:<3} subprocess {sub_ms:8.2f} ms   thread {thread_ms:8.2f} ms (loop lag p99 {thread_lag:7.2f} ms)"
+                  f"   process {process_ms:8.2f} ms (loop lag p99 {process_lag:5.2f} ms)   x{sub_ms / process_ms:5.1f}   {match}")
+
+
+if __name__ == "__main__":
+    paths = sys.argv[1:]
+    tmp = None
+    if not paths:
+        tmp = tempfile.NamedTemporaryFile(suffix=".exe", delete=False)
+        tmp.close()
+        make_pe(tmp.name)
+        paths = [os.path.realpath(sys.executable), tmp.name]
+    check_boundaries()
+    workers.start(1)
+    try:
+        asyncio.run(main(paths))
+    finally:
+        workers.shutdown()
+        if tmp:
+            os.remove(tmp.name)
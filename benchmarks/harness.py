@@ -0,0 +1,166 @@
+"""
+stand-ins for discord.Interaction and discord.Attachment, enough to drive the
+command handlers in main.py without a gateway connection
+
+    interaction = FakeInteraction()
+    await main.strings.callback(interaction, file=FakeAttachment("a.bin", data))
+    interaction.sent  # everything the handler sent back
+
+plus the measurements the benchmarks share: event loop lag and peak RSS
+"""
+import asyncio
+import itertools
+import os
+import time
+
+import discord
+
+_ids = itertools.count(1)
+
+
+class FakeAttachment:
+    '''data can also be a callable returning the bytes (with size given), so big
+    uploads only exist once the handler has downloaded them, like the real thing'''
+
+    def __init__(self, filename, data, latency=0.0, size=None, url=None):
+        self.id = next(_ids)
+        self.filename = filename
+        self.size = len(data) if size is None else size
+        # commands that stream the attachment (/exif) fetch this, point it at benchmarks.stub_maps
+        self.url = url or f"https://cdn.invalid/{self.id}/{filename}"
+        self._data = data
+        self._latency = latency
+
+    async def read(self):
+        if self._latency:
+            await asyncio.sleep(self._latency)
+        return self._data() if callable(self._data) else self._data
+
+
+class FakeUser:
+    def __init__(self, id):
+        self.id = id
+        self.name = f"user{id}"
+
+
+class FakeAsset:
+    def __init__(self, url):
+        self.url = url
+
+
+class FakeBotUser(FakeUser):
+    def __init__(self, id=0):
+        super().__init__(id)
+        self.name = "ctfbot"
+        self.avatar = FakeAsset("https://cdn.invalid/avatar.png")
+        self.display_avatar = self.avatar
+
+
+def log_in(client):
+    '''Give a client that never connected a user, handlers put its avatar in embeds'''
+    client._connection.user = FakeBotUser()
+
+
+class FakeMessage:
+    def __init__(self, interaction, kwargs):
+        self.interaction = interaction
+        self.id = next(_ids)
+        self.kwargs = kwargs
+
+    async def edit(self, **kwargs):
+        self.interaction.edits.append(kwargs)
+        self.kwargs.update(kwargs)
+        return self
+
+
+class _Response:
+    def __init__(self, interaction):
+        self.interaction = interaction
+        self._done = False
+
+    def is_done(self):
+        return self._done
+
+    async def defer(self, **kwargs):
+        self._done = True
+
+    async def send_message(self, content=None, **kwargs):
+        self._done = True
+        self.interaction._record(content, kwargs)
+
+
+class _Followup:
+    def __init__(self, interaction):
+        self.interaction = interaction
+
+    async def send(self, content=None, wait=False, **kwargs):
+        return self.interaction._record(content, kwargs)
+
+
+class FakeInteraction:
+    '''Records what a handler sends; first_reply is the perf_counter() time of its first message'''
+
+    def __init__(self, user=1, guild=1):
+        self.id = next(_ids)
+        self.user = FakeUser(user)
+        self.guild_id = guild
+        self.created_at = discord.utils.utcnow()
+        self.response = _Response(self)
+        self.followup = _Followup(self)
+        self.sent = []
+        self.edits = []
+        self.first_reply = None
+
+    async def edit_original_response(self, **kwargs):
+        self.edits.append(kwargs)
+
+    async def delete_original_response(self):
+        pass
+
+    def _record(self, content, kwargs):
+        if self.first_reply is None:
+            self.first_reply = time.perf_counter()
+        message = FakeMessage(self, dict(kwargs, content=content))
+        self.sent.append(message.kwargs)
+        return message
+
+    def text(self):
+        '''Every message and attached file, decoded, for checking results'''
+        parts = []
+        for message in self.sent:
+            if message.get("content"):
+                parts.append(message["content"])
+            if message.get("file"):
+                message["file"].fp.seek(0)
+                parts.append(message["file"].fp.read().decode(errors="replace"))
+            if message.get("embed"):
+                parts.append(message["embed"].description or "")
+        return "\n".join(parts)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)] if values else None
+
+
+async def measure_lag(stop, samples, interval=0.01):
+    '''How late the loop wakes up from a short sleep, i.e. how long something else blocked it'''
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(interval)
+        samples.append(loop.time() - start - interval)
+
+
+def rss():
+    '''Resident set size of this process in bytes'''
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+async def sample_rss(stop, peak, interval=0.01):
+    '''Keep peak[0] at the highest RSS seen until stop is set'''
+    while not stop.is_set():
+        # in a thread so the sampling doesn't show up as blocking io in the watchdog's strict mode
+        peak[0] = max(peak[0], await asyncio.to_thread(rss))
+        await asyncio.sleep(interval)
@@ -0,0 +1,78 @@
+"""
+drive /strings through main.py's real handler with fake interactions and report throughput
+
+usage: python -m benchmarks.load_test [--requests 64] [--concurrency 16] [--size 8388608] [--processes 0]
+--processes 0 scans in threads on the bot's own event loop process, N > 0 uses N
+worker processes (utils.workers), like "deployment.worker_processes" in config.json.
+every request uploads a different random file so the result cache never answers
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.getcwd())
+
+import main as bot  # noqa: E402
+from benchmarks.harness import FakeAttachment, FakeInteraction, measure_lag  # noqa: E402
+from utils import workers  # noqa: E402
+from utils.cache import ResultCache  # noqa: E402
+from utils.scheduler import JobScheduler  # noqa: E402
+
+
+async def one(data, index, limit, latencies):
+    interaction = FakeInteraction(user=index, guild=index % 7)
+    start = time.perf_counter()
+    await bot.strings.callback(interaction, file=FakeAttachment(f"sample{index}.bin", data), limit=limit)
+    latencies.append(time.perf_counter() - start)
+    return interaction
+
+
+async def run(args):
+    base = os.urandom(args.size)
+    files = [index.to_bytes(8, "little") + base[8:] for index in range(args.requests)]
+
+    bot.result_cache = ResultCache(directory=tempfile.mkdtemp(prefix="ctfbot-load-"))
+    bot.scheduler = JobScheduler(
+        tools={"strings": {"concurrency": args.concurrency, "timeout": 600}},
+        max_queue=args.requests, max_per_user=args.requests
+    )
+
+    stop, lag, latencies = asyncio.Event(), [], []
+    lag_task = asyncio.create_task(measure_lag(stop, lag))
+
+    start = time.perf_counter()
+    interactions = await asyncio.gather(*(one(data, i, args.limit, latencies) for i, data in enumerate(files)))
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    await lag_task
+
+    errors = sum("error occurred" in interaction.text() for interaction in interactions)
+    latencies.sort()
+    lag.sort()
+    mode = f"{args.processes} worker processes" if args.processes else "threads"
+    print(f"{args.requests} x /strings on {args.size / 1024 / 1024:.0f} MiB, {mode}, concurrency {args.concurrency}")
+    print(f"  throughput {args.requests / elapsed:.1f} req/s ({args.requests * args.size / elapsed / 1024 / 1024:.0f} MiB/s), {errors} errors")
+    print(f"  latency p50 {latencies[len(latencies) // 2]:.3f} s, p99 {latencies[int(len(latencies) * 0.99)]:.3f} s")
+    print(f"  event loop lag p50 {lag[len(lag) // 2] * 1000:.1f} ms, max {lag[-1] * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--size", type=int, default=8 * 1024 * 1024)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--processes", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.processes:
+        workers.start(args.processes)
+    try:
+        asyncio.run(run(args))
+    finally:
+        workers.shutdown()
@@ -0,0 +1,89 @@
+"""
+a local stand-in for the geoapify static map api, and a file server standing in for
+discord's cdn so /exif can stream attachments from it
+
+usage: python -m benchmarks.stub_maps [--port 8090] [--latency 0.1]
+then point the bot at it with "exif": {"map": {"url": "http://127.0.0.1:8090/v1/staticmap"}} in config.json
+
+files put in app["files"] (name -> bytes) are served on /attachments/<name> in
+chunks, app["sent"] counts the bytes that actually went out, so a reader that
+stops early can be seen to stop the transfer. app["maps"] counts map requests
+"""
+import argparse
+import asyncio
+import struct
+import zlib
+
+from aiohttp import web
+
+CHUNK_SIZE = 64 * 1024
+
+
+def solid_png(width, height, rgb=(170, 211, 223)):
+    '''a valid single colour PNG, the map the stub hands out'''
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    rows = b"".join(b"\x00" + bytes(rgb) * width for _ in range(height))
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(rows))
+        + chunk(b"IEND", b"")
+    )
+
+
+def make_app(latency=0.0):
+    app = web.Application()
+    app["maps"] = 0
+    app["files"] = {}
+    app["sent"] = {}  # name -> bytes written before the client stopped reading
+
+    async def staticmap(request):
+        app["maps"] += 1
+        await asyncio.sleep(latency)
+        if not request.query.get("apiKey"):
+            return web.json_response({"error": "Unauthorized", "message": "apiKey is missing"}, status=401)
+        width, height = int(request.query.get("width", 640)), int(request.query.get("height", 360))
+        return web.Response(body=solid_png(width, height), content_type="image/png")
+
+    async def attachment(request):
+        name = request.match_info["name"]
+        data = app["files"].get(name)
+        if data is None:
+            raise web.HTTPNotFound()
+
+        response = web.StreamResponse(headers={"Content-Type": "application/octet-stream"})
+        response.content_length = len(data)
+        await response.prepare(request)
+        app["sent"][name] = 0
+        try:
+            for start in range(0, len(data), CHUNK_SIZE):
+                await response.write(data[start:start + CHUNK_SIZE])
+                app["sent"][name] += len(data[start:start + CHUNK_SIZE])
+            await response.write_eof()
+        except ConnectionError:
+            pass
+        return response
+
+    app.router.add_get("/v1/staticmap", staticmap)
+    app.router.add_get("/attachments/{name}", attachment)
+    return app
+
+
+async def start(port=0, **kwargs):
+    '''start the stub in the running loop, returns (runner, base_url)'''
+    runner = web.AppRunner(make_app(**kwargs))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", port)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds to wait before answering a map request")
+    args = parser.parse_args()
+    web.run_app(make_app(args.latency), host="127.0.0.1", port=args.port)
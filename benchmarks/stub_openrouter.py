@@ -0,0 +1,137 @@
+"""
+a local stand-in for the openrouter chat completions endpoint
+
+usage: python -m benchmarks.stub_openrouter [--port 8089] [--latency 0.2] [--token-delay 0.02] [--reply "text"]
+       [--model-latency model=seconds ...] [--fail-model model ...] [--failure-rate 0.1] [--failure-status 503] [--empty-rate 0.1]
+       [--long-rate 0.1] [--long-chars 10000]
+then point the bot at it with "llm": {"base_url": "http://127.0.0.1:8089/api/v1"} in config.json
+
+the fault settings live in app["faults"] and can be changed while the stub runs,
+which is how the model router is exercised: slow one model down, fail another
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+from aiohttp import web
+
+
+def completion_body(model, content):
+    return {
+        "id": f"gen-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop"
+        }],
+        "usage": {"prompt_tokens": 0, "completion_tokens": len(content.split()), "total_tokens": len(content.split())}
+    }
+
+
+def chunk_body(model, delta, finish_reason=None):
+    return {
+        "id": "gen-stream",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+    }
+
+
+async def stream_response(request, model, content, token_delay):
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+    await response.prepare(request)
+
+    async def event(payload):
+        await response.write(f"data: {json.dumps(payload)}\n\n".encode())
+
+    await event(chunk_body(model, {"role": "assistant", "content": ""}))
+    for token in content.split(" "):
+        await asyncio.sleep(token_delay)
+        await event(chunk_body(model, {"content": token + " "}))
+    await event(chunk_body(model, {}, "stop"))
+    await response.write(b"data: [DONE]\n\n")
+    await response.write_eof()
+    return response
+
+
+def make_app(latency=0.0, reply=None, token_delay=0.0, model_latency=None, fail_models=(), failure_rate=0.0, failure_status=503, empty_rate=0.0,
+             long_rate=0.0, long_chars=10000):
+    app = web.Application()
+    app["requests"] = 0
+    app["models"] = {}  # model -> requests
+    app["faults"] = {
+        "model_latency": dict(model_latency or {}),  # overrides latency for these models
+        "fail_models": set(fail_models),  # always answer these with failure_status
+        "failure_rate": failure_rate,  # rates are a float for every model or {model: rate}
+        "failure_status": failure_status,
+        "empty_rate": empty_rate,  # answer with no choices at all
+        "long_rate": long_rate,  # pad the answer to long_chars, past what one embed holds
+        "long_chars": long_chars,
+    }
+
+    def chance(rate, model):
+        return random.random() < (rate.get(model, 0.0) if isinstance(rate, dict) else rate)
+
+    async def chat_completions(request):
+        body = await request.json()
+        model = body["model"]
+        faults = app["faults"]
+        app["requests"] += 1
+        app["models"][model] = app["models"].get(model, 0) + 1
+        await asyncio.sleep(faults["model_latency"].get(model, latency))
+
+        if model in faults["fail_models"] or chance(faults["failure_rate"], model):
+            return web.json_response({"error": {"message": "injected failure", "code": faults["failure_status"]}}, status=faults["failure_status"])
+        if chance(faults["empty_rate"], model):
+            return web.json_response(dict(completion_body(model, ""), choices=[]))
+
+        question = body["messages"][-1]["content"]
+        content = reply or f"stub answer to: {question}"
+        if chance(faults["long_rate"], model):
+            # 200 character words, so streaming it doesn't take thousands of token delays
+            content += " " + " ".join(["x" * 199] * (faults["long_chars"] // 200))
+        if body.get("stream"):
+            return await stream_response(request, model, content, token_delay)
+        return web.json_response(completion_body(model, content))
+
+    app.router.add_post("/api/v1/chat/completions", chat_completions)
+    return app
+
+
+async def start(port=0, **kwargs):
+    '''start the stub in the running loop, returns (runner, base_url)'''
+    runner = web.AppRunner(make_app(**kwargs))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", port)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/api/v1"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds to wait before answering")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="seconds between streamed tokens")
+    parser.add_argument("--reply", default=None, help="fixed answer, defaults to echoing the question")
+    parser.add_argument("--model-latency", action="append", default=[], metavar="MODEL=SECONDS", help="latency for one model")
+    parser.add_argument("--fail-model", action="append", default=[], metavar="MODEL", help="always fail requests for this model")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of requests that fail")
+    parser.add_argument("--failure-status", type=int, default=503, help="http status for injected failures")
+    parser.add_argument("--empty-rate", type=float, default=0.0, help="fraction of answers with empty choices")
+    parser.add_argument("--long-rate", type=float, default=0.0, help="fraction of answers padded past one embed")
+    parser.add_argument("--long-chars", type=int, default=10000, help="length of the padded answers")
+    args = parser.parse_args()
+    model_latency = {model: float(seconds) for model, seconds in (item.rsplit("=", 1) for item in args.model_latency)}
+    web.run_app(
+        make_app(args.latency, args.reply, args.token_delay, model_latency, args.fail_model, args.failure_rate, args.failure_status, args.empty_rate,
+                 args.long_rate, args.long_chars),
+        host="127.0.0.1", port=args.port
+    )
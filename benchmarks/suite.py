@@ -0,0 +1,291 @@
+"""
+end to end benchmarks for every command handler, against fake interactions, the
+stub openrouter and map servers and the canned floss in benchmarks/tools
+
+usage: python -m benchmarks.suite [--scenario strings ...] [--scale 1.0] [--strings-size 10485760]
+                                  [--output benchmark-report.json] [--baseline old-report.json] [--tolerance 0.25]
+                                  [--strict] [--threads]
+
+every scenario fires all of its requests at once and records latency, throughput,
+errors, per-stage timings, event loop lag and peak RSS. the report is json; with
+--baseline the run fails (exit status 1) when latency, throughput or memory got
+worse than the baseline by more than --tolerance. --strict runs the loop watchdog
+in strict mode, so every file access left on the event loop is logged and counted.
+strings are scanned in worker processes like the bot does, --threads scans them in
+threads instead (deployment.worker_processes = 0) to show what that does to loop lag
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.getcwd())
+
+import main as bot  # noqa: E402
+from benchmarks import stub_maps, stub_openrouter  # noqa: E402
+from benchmarks.bench_exif import locations, sample_jpeg  # noqa: E402
+from benchmarks.bench_magic import corpus  # noqa: E402
+from benchmarks.harness import FakeAttachment, FakeInteraction, log_in, measure_lag, percentile, rss, sample_rss  # noqa: E402
+from discord import app_commands  # noqa: E402
+from utils import metrics, workers  # noqa: E402
+from utils.answers import AnswerCache  # noqa: E402
+from utils.cache import ResultCache  # noqa: E402
+from utils.floss_pool import FlossPool  # noqa: E402
+from utils.llm import LLMClient  # noqa: E402
+from utils.maps import StaticMaps  # noqa: E402
+from utils.router import ModelRouter  # noqa: E402
+from utils.scheduler import JobScheduler  # noqa: E402
+from utils.watchdog import LoopWatchdog  # noqa: E402
+
+CANNED_FLOSS = os.path.join("benchmarks", "tools", "floss")
+MIB = 1024 * 1024
+
+# metric -> (bigger is better, changes smaller than this are noise whatever the percentage)
+TRACKED = {
+    "latency_p95_ms": (False, 5),
+    "throughput_rps": (True, 0),
+    "peak_rss_mib": (False, 5),
+    "loop_lag_p99_ms": (False, 25),
+}
+
+
+def strings_requests(count, size):
+    base = os.urandom(size)
+
+    def request(i):
+        # random bytes rarely hold 50 printable chars in a row, so every file is scanned end to end
+        data = lambda: i.to_bytes(8, "little") + base[8:]  # noqa: E731
+        return bot.strings, {"file": FakeAttachment(f"strings{i}.bin", data, size=size), "limit": 50}
+    return [request(i) for i in range(count)]
+
+
+def floss_requests(count, size):
+    base = os.urandom(size)
+    return [
+        (bot.floss, {"file": FakeAttachment(f"floss{i}.bin", i.to_bytes(8, "little") + base[8:]), "limit": 6})
+        for i in range(count)
+    ]
+
+
+def filetype_requests(count):
+    # known formats come from the signature table, random bytes go to the (stub) model
+    samples = [data for _, data in corpus()] + [os.urandom(512)]
+    return [
+        (bot.filetype, {"file": FakeAttachment(f"filetype{i}", samples[i % len(samples)][:-1] + bytes([i % 256]))})
+        for i in range(count)
+    ]
+
+
+def ask_requests(count):
+    model = bot.router.models[0]
+    choice = app_commands.Choice(name=model["name"], value=model["id"])
+    return [(bot.ask, {"model": choice, "question": f"benchmark question {i}"}) for i in range(count)]
+
+
+def exif_requests(count, size, maps_app, maps_url):
+    # photos from a few places close together, so most maps come from the cache
+    places = locations(5)
+    requests = []
+    for i in range(count):
+        name = f"photo{i}.jpg"
+        maps_app["files"][name] = sample_jpeg(*places[i % len(places)], size)
+        attachment = FakeAttachment(name, b"", size=size, url=f"{maps_url}/attachments/{name}")
+        requests.append((bot.exif, {"file": attachment}))
+    return requests
+
+
+def batch_requests(count, entries, size):
+    def archive(i):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as z:
+            for entry in range(entries):
+                z.writestr(f"entry{entry}.bin", i.to_bytes(4, "little") + entry.to_bytes(4, "little") + os.urandom(size))
+        return buffer.getvalue()
+
+    return [
+        (bot.strings, {"file": FakeAttachment(f"batch{i}.zip", archive(i)), "limit": 8, "expand": True})
+        for i in range(count)
+    ]
+
+
+def scenarios(args, maps_app, maps_url):
+    '''name -> function building the request list, built lazily so unused ones cost nothing'''
+    scale = lambda n: max(1, int(n * args.scale))  # noqa: E731
+    return {
+        "strings": lambda: strings_requests(scale(200), args.strings_size),
+        "floss": lambda: floss_requests(scale(20), MIB),
+        "filetype": lambda: filetype_requests(scale(200)),
+        "ask": lambda: ask_requests(scale(100)),
+        "batch": lambda: batch_requests(scale(5), 20, 256 * 1024),
+        "exif": lambda: exif_requests(scale(200), 2 * MIB, maps_app, maps_url),
+    }
+
+
+def prepare(stub_url, maps_url):
+    '''Point main.py at throwaway state and the local stand-ins'''
+    log_in(bot.client)
+    bot.result_cache = ResultCache(directory=tempfile.mkdtemp(prefix="ctfbot-suite-"))
+    # keep the configured concurrency, but queue everything: this measures work, not admission
+    bot.scheduler = JobScheduler(
+        tools={tool: dict(settings, timeout=600) for tool, settings in bot.scheduler.tools.items()},
+        max_queue=10 ** 6, max_per_user=10 ** 6
+    )
+    bot.floss_pool = FlossPool(size=0, binary=CANNED_FLOSS)
+    bot.llm = LLMClient("stub", base_url=stub_url, max_retries=0)
+    bot.router = ModelRouter(bot.llm, bot.router.models)
+    bot.answer_cache = AnswerCache()
+    bot.static_maps = StaticMaps(bot.http, api_key="stub", url=f"{maps_url}/v1/staticmap", directory=tempfile.mkdtemp(prefix="ctfbot-suite-maps-"))
+
+
+async def run_scenario(name, requests):
+    command_name = requests[0][0].name
+    errors_before = metrics.COMMAND_ERRORS.value(command=command_name)
+    blocking_before = metrics.BLOCKING_IO.total()
+    latencies, first_replies = [], []
+
+    async def one(index, command, kwargs):
+        interaction = FakeInteraction(user=index, guild=index % 7)
+        start = time.perf_counter()
+        await command.callback(interaction, **kwargs)
+        latencies.append(time.perf_counter() - start)
+        if interaction.first_reply:
+            first_replies.append(interaction.first_reply - start)
+
+    stop, lag, peak = asyncio.Event(), [], [await asyncio.to_thread(rss)]
+    baseline_rss = peak[0]
+    watchers = [asyncio.create_task(measure_lag(stop, lag)), asyncio.create_task(sample_rss(stop, peak))]
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i, command, kwargs) for i, (command, kwargs) in enumerate(requests)))
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    await asyncio.gather(*watchers)
+
+    ms = lambda seconds: None if seconds is None else round(seconds * 1000, 2)  # noqa: E731
+    return {
+        "command": command_name,
+        "requests": len(requests),
+        "errors": int(metrics.COMMAND_ERRORS.value(command=command_name) - errors_before),
+        "blocking_io": int(metrics.BLOCKING_IO.total() - blocking_before),
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(requests) / elapsed, 2),
+        "latency_p50_ms": ms(percentile(latencies, 0.5)),
+        "latency_p95_ms": ms(percentile(latencies, 0.95)),
+        "latency_p99_ms": ms(percentile(latencies, 0.99)),
+        "latency_max_ms": ms(max(latencies)),
+        "first_reply_p50_ms": ms(percentile(first_replies, 0.5)),
+        "stages_p50_ms": {
+            labels["stage"]: ms(metrics.STAGE_SECONDS.quantile(0.5, **labels))
+            for labels in metrics.STAGE_SECONDS.label_sets() if labels["command"] == command_name
+        },
+        "loop_lag_p50_ms": ms(percentile(lag, 0.5)),
+        "loop_lag_p99_ms": ms(percentile(lag, 0.99)),
+        "loop_lag_max_ms": ms(max(lag, default=0)),
+        "peak_rss_mib": round(peak[0] / MIB, 1),
+        "rss_growth_mib": round((peak[0] - baseline_rss) / MIB, 1),
+    }
+
+
+def compare(report, baseline, tolerance):
+    '''Lines describing every tracked number that got worse by more than tolerance'''
+    regressions = []
+    for name, result in report["scenarios"].items():
+        old = baseline.get("scenarios", {}).get(name)
+        if not old:
+            continue
+        for key, (bigger_is_better, noise) in TRACKED.items():
+            if not old.get(key) or result.get(key) is None or abs(result[key] - old[key]) <= noise:
+                continue
+            change = (result[key] - old[key]) / old[key]
+            if (-change if bigger_is_better else change) > tolerance:
+                regressions.append(f"{name}.{key}: {old[key]} -> {result[key]} ({change:+.0%})")
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main(args):
+    # some answers run past one embed, so spilling into more messages is exercised too
+    stub_runner, stub_url = await stub_openrouter.start(latency=args.llm_latency, token_delay=args.token_delay, long_rate=0.2, long_chars=10000)
+    maps_runner, maps_url = await stub_maps.start(latency=args.map_latency)
+    prepare(stub_url, maps_url)
+    if args.strict:
+        bot.watchdog = LoopWatchdog(strict=True)
+        bot.watchdog.start()
+    # the bot loads openai in on_ready, well before the first /ask
+    await bot.llm.start()
+
+    available = scenarios(args, maps_runner.app, maps_url)
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "settings": {"scale": args.scale, "strings_size": args.strings_size, "strict": args.strict, "worker_processes": workers.started()},
+        "scenarios": {},
+    }
+    try:
+        for name in args.scenario or available:
+            requests = available[name]()
+            result = await run_scenario(name, requests)
+            del requests
+            report["scenarios"][name] = result
+            print(f"{name:<9} {result['requests']:>4} req  {result['throughput_rps']:>8.2f} req/s  "
+                  f"p50 {result['latency_p50_ms']:>9.1f} ms  p95 {result['latency_p95_ms']:>9.1f} ms  "
+                  f"lag p99 {result['loop_lag_p99_ms']:>7.1f} ms  rss {result['peak_rss_mib']:>7.1f} MiB  "
+                  f"errors {result['errors']}")
+    finally:
+        await bot.llm.close()
+        await stub_runner.cleanup()
+        await bot.http.aclose()
+        await maps_runner.cleanup()
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=4)
+    print(f"report written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenario", action="append", choices=["strings", "floss", "filetype", "ask", "batch", "exif"])
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplies every scenario's request count")
+    parser.add_argument("--strings-size", type=int, default=10 * MIB)
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    parser.add_argument("--map-latency", type=float, default=0.2)
+    parser.add_argument("--output", default="benchmark-report.json")
+    parser.add_argument("--baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--strict", action="store_true", help="log and count file access on the event loop")
+    parser.add_argument("--threads", action="store_true", help="scan strings in threads, not worker processes")
+    args = parser.parse_args()
+    if not args.threads:
+        bot.start_workers()
+    try:
+        status = asyncio.run(main(args))
+    finally:
+        workers.shutdown()
+    sys.exit(status)
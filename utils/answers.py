@@ -0,0 +1,129 @@
+import asyncio
+import re
+import time
+import unicodedata
+from collections import Counter, OrderedDict
+
+
+def normalize(question):
+    '''Case, unicode form, whitespace and trailing punctuation don't change the question'''
+    question = unicodedata.normalize("NFKC", question).casefold()
+    return re.sub(r"\s+", " ", question).strip(" ?!.")
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+class Hit:
+    def __init__(self, answer, question, age, exact):
+        self.answer = answer
+        self.question = question  # the question the answer was originally given for
+        self.age = age
+        self.exact = exact
+
+
+class AnswerCache:
+    '''/ask answers keyed on (model, normalized question), with a TTL and LRU eviction.
+
+    With fuzzy_threshold set, a miss falls back to the most similar cached
+    question for the same model, measured as the Jaccard similarity of their
+    character trigrams and found through an inverted index. single_flight()
+    makes concurrent identical questions share one upstream request.
+    '''
+
+    def __init__(self, ttl=24 * 60 * 60, max_entries=1000, fuzzy_threshold=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.fuzzy_threshold = fuzzy_threshold
+
+        self._entries = OrderedDict()  # (model, normalized) -> (answer, question, created)
+        self._grams = {}
+        self._postings = {}  # (model, trigram) -> set of keys
+        self._inflight = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, model, question):
+        key = (model, normalize(question))
+        hit = self._get(key, exact=True)
+        if hit is None and self.fuzzy_threshold:
+            similar = self._similar(key)
+            if similar:
+                hit = self._get(similar, exact=False)
+        return hit
+
+    def set(self, model, question, answer):
+        key = (model, normalize(question))
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (answer, question, time.monotonic())
+        if self.fuzzy_threshold:
+            grams = trigrams(key[1])
+            self._grams[key] = grams
+            for gram in grams:
+                self._postings.setdefault((model, gram), set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    async def single_flight(self, model, question, produce):
+        '''Return (answer, shared). produce() runs once per question at a time, whoever
+        asks the same thing while it is running gets its answer with shared=True.'''
+        key = (model, normalize(question))
+        if key in self._inflight:
+            return await asyncio.shield(self._inflight[key]), True
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            answer = await produce()
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                future.set_exception(RuntimeError("The identical question this was waiting on was cancelled"))
+            else:
+                future.set_exception(e)
+            # nobody may be waiting, don't let asyncio complain about it
+            future.exception()
+            raise
+        else:
+            self.set(model, question, answer)
+            future.set_result(answer)
+            return answer, False
+        finally:
+            del self._inflight[key]
+
+    def _get(self, key, exact):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        answer, question, created = entry
+        age = time.monotonic() - created
+        if age > self.ttl:
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return Hit(answer, question, age, exact)
+
+    def _similar(self, key):
+        model, text = key
+        grams = trigrams(text)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self._postings.get((model, gram), ()))
+
+        best, best_score = None, self.fuzzy_threshold
+        for candidate, overlap in shared.items():
+            score = overlap / (len(grams) + len(self._grams[candidate]) - overlap)
+            if score >= best_score:
+                best, best_score = candidate, score
+        return best
+
+    def _remove(self, key):
+        del self._entries[key]
+        for gram in self._grams.pop(key, ()):
+            keys = self._postings[(key[0], gram)]
+            keys.discard(key)
+            if not keys:
+                del self._postings[(key[0], gram)]
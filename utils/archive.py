@@ -0,0 +1,151 @@
+import bz2
+import gzip
+import io
+import lzma
+import tarfile
+import zipfile
+import zlib
+
+CHUNK_SIZE = 64 * 1024
+
+ZIP_MAGIC = (b"PK\x03\x04", b"PK\x05\x06")  # first local file header, or the end record of an empty zip
+TAR_MAGIC_OFFSET = 257
+# compressed tars by magic bytes, each opener gives a file object that decompresses as it is read
+COMPRESSIONS = [
+    (b"\x1f\x8b", lambda f: gzip.GzipFile(fileobj=f)),
+    (b"BZh", bz2.BZ2File),
+    (b"\xfd7zXZ\x00", lzma.LZMAFile),
+]
+
+
+class ArchiveLimits:
+    def __init__(self, max_entries=100, max_entry_size=25 * 1024 * 1024, max_total_size=100 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_entry_size = max_entry_size
+        self.max_total_size = max_total_size
+
+
+class _Budget:
+    '''Tracks what has actually been decompressed, header sizes can't be trusted in a zip bomb'''
+
+    def __init__(self, limits):
+        self.limits = limits
+        self.entries = 0
+        self.total = 0
+
+    def entry(self):
+        self.entries += 1
+        if self.entries > self.limits.max_entries:
+            raise ValueError(f"Archive has more than {self.limits.max_entries} entries")
+
+    def consume(self, size):
+        self.total += size
+        if self.total > self.limits.max_total_size:
+            raise ValueError(f"Archive is larger than {self.limits.max_total_size} bytes uncompressed")
+
+    def read(self, name, stream, counted=False):
+        '''Read one entry, counted is set when the stream's bytes already went through consume()'''
+        chunks = []
+        size = 0
+        while chunk := stream.read(CHUNK_SIZE):
+            size += len(chunk)
+            if size > self.limits.max_entry_size:
+                raise ValueError(f"{name} is larger than {self.limits.max_entry_size} bytes uncompressed")
+            if not counted:
+                self.consume(len(chunk))
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+
+class _CountingReader:
+    '''Sits between the decompressor and tarfile and charges every byte to the budget.
+
+    tarfile reads GNU longname and pax headers whole before handing out a
+    member, so counting only member contents would let a single header fill
+    memory. Reads are cut into CHUNK_SIZE pieces so the limit hits before that.
+    '''
+
+    def __init__(self, stream, budget):
+        self.stream = stream
+        self.budget = budget
+
+    def read(self, size=-1):
+        chunks = []
+        while size:
+            chunk = self.stream.read(CHUNK_SIZE if size < 0 else min(size, CHUNK_SIZE))
+            if not chunk:
+                break
+            self.budget.consume(len(chunk))
+            chunks.append(chunk)
+            if size > 0:
+                size -= len(chunk)
+        return b"".join(chunks)
+
+
+def _expand_zip(data, budget):
+    entries, skipped = [], []
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        for info in archive.infolist():
+            budget.entry()
+            if info.is_dir():
+                continue
+            if info.flag_bits & 0x1:
+                skipped.append((info.filename, "encrypted"))
+                continue
+            try:
+                with archive.open(info) as stream:
+                    entries.append((info.filename, budget.read(info.filename, stream)))
+            except (NotImplementedError, zipfile.BadZipFile) as e:
+                skipped.append((info.filename, str(e)))
+    return entries, skipped
+
+
+def _expand_tar(data, budget):
+    entries, skipped = [], []
+    # "r|" reads the stream front to back without seeking, tarfile keeps every member
+    # it has seen, so directories and links count as entries too
+    with tarfile.open(fileobj=_CountingReader(_decompressed(data), budget), mode="r|") as archive:
+        for member in archive:
+            budget.entry()
+            if member.isdir():
+                continue
+            if not member.isfile():
+                skipped.append((member.name, "not a regular file"))
+                continue
+            entries.append((member.name, budget.read(member.name, archive.extractfile(member), counted=True)))
+    return entries, skipped
+
+
+def _decompressed(data):
+    stream = io.BytesIO(data)
+    for magic, opener in COMPRESSIONS:
+        if data.startswith(magic):
+            return opener(stream)
+    return stream
+
+
+def _is_zip(data):
+    return bytes(data[:4]) in ZIP_MAGIC
+
+
+def is_archive(data):
+    '''Check the magic bytes, of a compressed tar only the first block is decompressed'''
+    if _is_zip(data):
+        return True
+    try:
+        block = _decompressed(data).read(512)
+    except (OSError, EOFError, zlib.error, lzma.LZMAError):
+        return False
+    return block[TAR_MAGIC_OFFSET:TAR_MAGIC_OFFSET + 5] == b"ustar"
+
+
+def expand(data, limits=None):
+    '''Return ([(name, bytes)], [(name, reason skipped)]) for a zip or (compressed) tar archive.
+
+    Entries are decompressed one chunk at a time and the whole expansion is
+    aborted with ValueError as soon as any limit is crossed.
+    '''
+    budget = _Budget(limits or ArchiveLimits())
+    if _is_zip(data):
+        return _expand_zip(data, budget)
+    return _expand_tar(data, budget)
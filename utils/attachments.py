@@ -0,0 +1,92 @@
+import asyncio
+import hashlib
+import os
+import re
+import tempfile
+from contextlib import asynccontextmanager
+
+from utils import metrics
+
+DEFAULT_MAX_SIZE = 25 * 1024 * 1024
+
+# prefer tmpfs so tools that need a path never touch the real disk
+SPOOL_DIR = "/dev/shm" if os.access("/dev/shm", os.W_OK) else tempfile.gettempdir()
+
+
+class Upload:
+    '''An attachment held in memory, spooled to a unique tmpfs file only when a tool needs a path'''
+
+    def __init__(self, filename, data):
+        self.filename = filename
+        self.data = data
+        self.view = memoryview(data)
+        self.size = len(data)
+        self._path = None
+        self._sha256 = None
+
+    async def sha256(self):
+        if self._sha256 is None:
+            # hashlib drops the GIL on large buffers, so this really runs in parallel
+            self._sha256 = await asyncio.to_thread(lambda: hashlib.sha256(self.view).hexdigest())
+        return self._sha256
+
+    async def path(self):
+        if self._path is None:
+            self._path = await asyncio.to_thread(self._spool)
+        return self._path
+
+    def _spool(self):
+        # keep the original name as a suffix so tool output still makes sense
+        safe_name = re.sub(r"[^A-Za-z0-9._-]", "_", os.path.basename(self.filename))[-64:]
+        fd, path = tempfile.mkstemp(prefix="ctfbot-", suffix=f"-{safe_name}", dir=SPOOL_DIR)
+        with os.fdopen(fd, "wb") as f:
+            f.write(self.view)
+        return path
+
+    def close(self):
+        if self._path is not None:
+            try:
+                os.remove(self._path)
+            except OSError as e:
+                print(f"Error cleaning up files: {e}")
+            self._path = None
+
+    async def aclose(self):
+        '''close() off the event loop, removing a file can block on a busy disk'''
+        if self._path is not None:
+            await asyncio.to_thread(self.close)
+
+
+async def read_attachment(attachment, max_size=DEFAULT_MAX_SIZE, command="unknown"):
+    # discord tells us the size up front, so oversized files are never downloaded
+    if attachment.size > max_size:
+        raise ValueError(f"File too large ({attachment.size} bytes, max is {max_size} bytes)")
+
+    with metrics.stage(command, "download"):
+        data = await attachment.read()
+    metrics.INGESTED_BYTES.inc(len(data))
+    if len(data) > max_size:
+        raise ValueError(f"File too large ({len(data)} bytes, max is {max_size} bytes)")
+
+    return Upload(attachment.filename, data)
+
+
+async def stream_attachment(attachment, http, chunk_size=64 * 1024, command="unknown"):
+    '''Yield an attachment's bytes as they are downloaded, for readers that only need the start of a file.
+    Closing the generator early stops the download.'''
+    with metrics.stage(command, "download"):
+        async with http.stream("GET", attachment.url) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes(chunk_size):
+                metrics.INGESTED_BYTES.inc(len(chunk))
+                yield chunk
+
+
+@asynccontextmanager
+async def ingest(attachment, max_size=DEFAULT_MAX_SIZE, command="unknown"):
+    '''Read an attachment into memory for the duration of a command and clean up afterwards'''
+    upload = await read_attachment(attachment, max_size, command)
+    try:
+        yield upload
+    finally:
+        await upload.aclose()
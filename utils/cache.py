@@ -0,0 +1,176 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+
+# what _disk_path() writes, anything else in the directory isn't a cached result
+_SHARD = re.compile(r"[0-9a-f]{2}")
+_ENTRY = re.compile(r"([0-9a-f]{64})\.json")
+
+
+class ResultCache:
+    '''Content-addressed cache for command results.
+
+    Keys are derived from the SHA-256 of the attachment plus the command name and
+    the parameters that affect its output. Values are anything json can encode.
+    There is an in-memory LRU tier bounded by total bytes and an optional on-disk
+    tier (one json file per key) that survives restarts, pruned least recently
+    used first once it holds more than disk_bytes.
+    '''
+
+    def __init__(self, memory_bytes=64 * 1024 * 1024, directory="cache", max_entry_bytes=8 * 1024 * 1024, disk_bytes=1024 * 1024 * 1024):
+        self.memory_bytes = memory_bytes
+        self.directory = directory
+        self.max_entry_bytes = max_entry_bytes
+        self.disk_bytes = disk_bytes
+
+        self._memory = OrderedDict()  # key -> (encoded json, value)
+        self._used = 0
+        # key -> size of its file, least recently used first. Read from the directory on
+        # first use rather than here, and only touched from worker threads, hence the lock
+        self._disk = None
+        self._disk_used = 0
+        self._disk_lock = threading.Lock()
+
+        self.hits = {"memory": 0, "disk": 0}
+        self.misses = 0
+
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(digest, command, params):
+        raw = f"{digest}:{command}:{json.dumps(params, sort_keys=True)}"
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def stats(self):
+        hits = sum(self.hits.values())
+        total = hits + self.misses
+        return {
+            **{f"hits_{tier}": n for tier, n in self.hits.items()},
+            "misses": self.misses,
+            "hit_rate": hits / total if total else 0.0,
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._used,
+            "disk_bytes": self._disk_used,
+        }
+
+    async def get(self, key):
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            self.hits["memory"] += 1
+            return self._memory[key][1]
+
+        if self.directory:
+            loaded = await asyncio.to_thread(self._load_disk, key)
+            if loaded is not None:
+                encoded, value = loaded
+                self._remember(key, encoded, value)
+                self.hits["disk"] += 1
+                return value
+
+        self.misses += 1
+        return None
+
+    async def set(self, key, value):
+        # results run to megabytes, encoding those would stall the event loop
+        encoded = await asyncio.to_thread(lambda: json.dumps(value).encode())
+        if len(encoded) > self.max_entry_bytes:
+            return
+        self._remember(key, encoded, value)
+        if self.directory:
+            await asyncio.to_thread(self._write_disk, key, encoded)
+
+    def _remember(self, key, encoded, value):
+        if key in self._memory:
+            self._used -= len(self._memory.pop(key)[0])
+        self._memory[key] = (encoded, value)
+        self._used += len(encoded)
+        while self._used > self.memory_bytes and self._memory:
+            _, (old, _) = self._memory.popitem(last=False)
+            self._used -= len(old)
+
+    def _disk_path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _read_disk(self, key):
+        try:
+            with open(self._disk_path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _load_disk(self, key):
+        encoded = self._read_disk(key)
+        if encoded is None:
+            return None
+        try:
+            value = json.loads(encoded)
+        except ValueError:
+            # a damaged file is a miss, the next set() writes a good one
+            self._delete_disk(key)
+            return None
+
+        with self._disk_lock:
+            index = self._disk_index()
+            if key in index:
+                index.move_to_end(key)
+        try:
+            # the modification time is the recency order after a restart
+            os.utime(self._disk_path(key))
+        except OSError:
+            pass
+        return encoded, value
+
+    def _write_disk(self, key, encoded):
+        path = self._disk_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(encoded)
+        os.replace(tmp, path)
+
+        with self._disk_lock:
+            index = self._disk_index()
+            self._disk_used += len(encoded) - index.pop(key, 0)
+            index[key] = len(encoded)
+            while self._disk_used > self.disk_bytes and len(index) > 1:
+                old, size = index.popitem(last=False)
+                self._disk_used -= size
+                self._unlink(old)
+
+    def _delete_disk(self, key):
+        with self._disk_lock:
+            self._disk_used -= self._disk_index().pop(key, 0)
+            self._unlink(key)
+
+    def _unlink(self, key):
+        try:
+            os.remove(self._disk_path(key))
+        except FileNotFoundError:
+            pass
+
+    def _disk_index(self):
+        # called with _disk_lock held
+        if self._disk is None:
+            found = []
+            for shard in os.listdir(self.directory):
+                if not _SHARD.fullmatch(shard):
+                    continue
+                for name in os.listdir(os.path.join(self.directory, shard)):
+                    match = _ENTRY.fullmatch(name)
+                    if not match or not match.group(1).startswith(shard):
+                        continue
+                    try:
+                        stat = os.stat(os.path.join(self.directory, shard, name))
+                    except FileNotFoundError:
+                        continue
+                    found.append((stat.st_mtime, match.group(1), stat.st_size))
+            found.sort()
+            self._disk = OrderedDict((key, size) for _, key, size in found)
+            self._disk_used = sum(self._disk.values())
+        return self._disk
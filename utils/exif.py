@@ -0,0 +1,449 @@
+import html
+import re
+import struct
+import zlib
+from contextlib import aclosing
+
+# JPEG APP segments hold at most 64 KiB each, this leaves room for a stack of them
+DEFAULT_MAX_HEADER = 4 * 1024 * 1024
+# PNG text chunks can be any size, bigger ones than this are skipped
+MAX_CHUNK = 1024 * 1024
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+XMP_HEADER = b"http://ns.adobe.com/xap/1.0/\x00"
+# start of frame markers, the ones carrying the image dimensions
+SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+# markers without a length field
+STANDALONE_MARKERS = {0x01} | set(range(0xD0, 0xD8))
+
+# TIFF field type -> (struct format, size), BYTE and UNDEFINED arrays are kept as bytes like ASCII
+TIFF_TYPES = {1: ("s", 1), 2: ("s", 1), 3: ("H", 2), 4: ("I", 4), 5: ("II", 8), 6: ("b", 1), 7: ("s", 1), 8: ("h", 2), 9: ("i", 4), 10: ("ii", 8)}
+
+# tag -> name, named like exiftool does so the output reads the same as before
+IFD0_TAGS = {
+    0x010E: "Image Description",
+    0x010F: "Make",
+    0x0110: "Camera Model Name",
+    0x0131: "Software",
+    0x0132: "Modify Date",
+    0x013B: "Artist",
+    0x8298: "Copyright",
+    0x9C9B: "XP Title",
+    0x9C9C: "XP Comment",
+    0x9C9D: "XP Author",
+    0x9C9E: "XP Keywords",
+    0x9C9F: "XP Subject",
+}
+EXIF_TAGS = {
+    0x829A: "Exposure Time",
+    0x829D: "F Number",
+    0x8827: "ISO",
+    0x9003: "Date/Time Original",
+    0x9004: "Create Date",
+    0x9201: "Shutter Speed",
+    0x920A: "Focal Length",
+    0x9286: "User Comment",
+    0xA002: "Exif Image Width",
+    0xA003: "Exif Image Height",
+    0xA433: "Lens Make",
+    0xA434: "Lens Model",
+}
+EXIF_IFD_POINTER = 0x8769
+GPS_IFD_POINTER = 0x8825
+
+# XMP property -> name, only used for what EXIF didn't already say
+XMP_TAGS = {
+    "tiff:Make": "Make",
+    "tiff:Model": "Camera Model Name",
+    "xmp:CreateDate": "Create Date",
+    "xmp:CreatorTool": "Software",
+    "exif:DateTimeOriginal": "Date/Time Original",
+    "dc:creator": "Artist",
+    "dc:rights": "Copyright",
+    "dc:title": "Title",
+    "dc:description": "Image Description",
+    "exif:GPSLatitude": "GPS Latitude",
+    "exif:GPSLongitude": "GPS Longitude",
+}
+# PNG text chunk keywords -> name
+PNG_TEXT = {
+    "Title": "Title",
+    "Author": "Artist",
+    "Description": "Image Description",
+    "Copyright": "Copyright",
+    "Creation Time": "Create Date",
+    "Software": "Software",
+    "Comment": "Comment",
+}
+
+
+def file_size(size):
+    '''Bytes the way exiftool prints them'''
+    if size < 1000:
+        return f"{size} bytes"
+    if size < 1000 * 1000:
+        return f"{size / 1000:.0f} kB"
+    return f"{size / 1000 / 1000:.1f} MB"
+
+
+def format_dms(degrees, ref):
+    '''Decimal degrees as 34 deg 3' 8.40" N, what parse_gps reads back'''
+    degrees = abs(degrees)
+    whole = int(degrees)
+    minutes = int((degrees - whole) * 60)
+    seconds = (degrees - whole - minutes / 60) * 3600
+    return f"{whole} deg {minutes}' {seconds:.2f}\" {ref}"
+
+
+def parse_gps(gps_string):
+    '''Convert GPS coordinates from EXIF format to decimal degrees'''
+    match = re.match(r"(\d+) deg (\d+)' ([\d.]+)\" ([NSEW]), (\d+) deg (\d+)' ([\d.]+)\" ([NSEW])", gps_string)
+    if not match:
+        return None  # Failed to parse
+
+    lat_deg, lat_min, lat_sec, lat_dir, lon_deg, lon_min, lon_sec, lon_dir = match.groups()
+
+    lat = float(lat_deg) + float(lat_min) / 60 + float(lat_sec) / 3600
+    lon = float(lon_deg) + float(lon_min) / 60 + float(lon_sec) / 3600
+
+    if lat_dir == 'S': lat = -lat
+    if lon_dir == 'W': lon = -lon
+
+    return lat, lon
+
+
+def _fraction(seconds):
+    if seconds <= 0:
+        return "0"
+    if seconds < 1:
+        return f"1/{round(1 / seconds)}"
+    return f"{seconds:g}"
+
+
+def _text(value):
+    if isinstance(value, bytes):
+        value = value.split(b"\x00", 1)[0].decode("utf-8", errors="replace")
+    return str(value).strip()
+
+
+class HeaderParser:
+    '''Reads metadata from the start of a JPEG or PNG as it is downloaded.
+
+    feed() takes the file a chunk at a time and returns True once it reaches
+    the image data (JPEG start of scan, PNG IDAT), so the rest of the file is
+    never fetched. Only the segments that carry metadata are buffered, the
+    others are skipped as they stream past. fields ends up with EXIF, XMP and
+    PNG text values under exiftool's names.
+    '''
+
+    def __init__(self, max_bytes=DEFAULT_MAX_HEADER):
+        self.max_bytes = max_bytes
+        self.fields = {}
+        self.format = None
+        self.bytes_read = 0
+        self.done = False
+
+        self._buffer = bytearray()
+        self._skip = 0
+        self._size = None
+
+    def feed(self, chunk):
+        '''Add the next piece of the file, returns True once no more is needed'''
+        if self.done:
+            return True
+        self.bytes_read += len(chunk)
+        if self._skip:
+            skipped = min(self._skip, len(chunk))
+            self._skip -= skipped
+            chunk = chunk[skipped:]
+        self._buffer += chunk
+
+        try:
+            self._parse()
+        except (struct.error, ValueError, TypeError, AttributeError, IndexError, zlib.error):
+            # a damaged header, keep whatever was read before it
+            self.done = True
+
+        if self.bytes_read >= self.max_bytes:
+            self.done = True
+        if self.done:
+            self._finish()
+        return self.done
+
+    def close(self):
+        '''The file ended, fill in what can be worked out from what was seen'''
+        if not self.done:
+            self.done = True
+            self._finish()
+
+    def _parse(self):
+        if self.format is None:
+            if len(self._buffer) < 8:
+                return
+            if self._buffer[:2] == b"\xff\xd8":
+                self.format = "JPEG"
+                del self._buffer[:2]
+            elif self._buffer[:8] == PNG_SIGNATURE:
+                self.format = "PNG"
+                del self._buffer[:8]
+            else:
+                self.format = "unknown"
+                self.done = True
+                return
+
+        step = self._jpeg_step if self.format == "JPEG" else self._png_step
+        while not self.done and step():
+            pass
+
+    def _take(self, end, interesting):
+        '''Pop the first `end` bytes if interesting and complete, skip them otherwise.
+        Returns the bytes, None when skipped, False when more data is needed.'''
+        if interesting:
+            if len(self._buffer) < end:
+                return False
+            data = bytes(self._buffer[:end])
+            del self._buffer[:end]
+            return data
+        if len(self._buffer) >= end:
+            del self._buffer[:end]
+        else:
+            self._skip = end - len(self._buffer)
+            self._buffer.clear()
+        return None
+
+    def _jpeg_step(self):
+        buffer = self._buffer
+        # markers can be padded with any number of 0xff bytes
+        i = 0
+        while i < len(buffer) and buffer[i] == 0xFF:
+            i += 1
+        if i == len(buffer):
+            return False
+        if i == 0:
+            raise ValueError("expected a JPEG marker")
+
+        marker = buffer[i]
+        if marker in STANDALONE_MARKERS:
+            del buffer[:i + 1]
+            return True
+        if marker in (0xDA, 0xD9):
+            # start of scan or end of image, everything after is pixels
+            self.done = True
+            return False
+        if len(buffer) < i + 3:
+            return False
+
+        length = buffer[i + 1] << 8 | buffer[i + 2]
+        if length < 2:
+            raise ValueError("bad JPEG segment length")
+        start = i + 3
+        segment = self._take(i + 1 + length, marker in SOF_MARKERS or marker in (0xE1, 0xFE))
+        if segment is False:
+            return False
+        if segment is None:
+            return True
+
+        segment = segment[start:]
+        if marker in SOF_MARKERS:
+            height, width = struct.unpack(">HH", segment[1:5])
+            self._size = (width, height)
+        elif marker == 0xFE:
+            self._set("Comment", _text(segment))
+        elif segment.startswith(b"Exif\x00\x00"):
+            self._tiff(segment[6:])
+        elif segment.startswith(XMP_HEADER):
+            self._xmp(segment[len(XMP_HEADER):].decode("utf-8", errors="replace"))
+        return True
+
+    def _png_step(self):
+        if len(self._buffer) < 8:
+            return False
+        length, chunk_type = struct.unpack(">I4s", self._buffer[:8])
+        if chunk_type in (b"IDAT", b"IEND"):
+            self.done = True
+            return False
+
+        interesting = chunk_type in (b"IHDR", b"eXIf", b"tEXt", b"zTXt", b"iTXt") and length <= MAX_CHUNK
+        chunk = self._take(8 + length + 4, interesting)
+        if chunk is False:
+            return False
+        if chunk is None:
+            return True
+
+        data = chunk[8:8 + length]
+        if chunk_type == b"IHDR":
+            self._size = struct.unpack(">II", data[:8])
+        elif chunk_type == b"eXIf":
+            self._tiff(data)
+        else:
+            self._png_text(chunk_type, data)
+        return True
+
+    def _png_text(self, chunk_type, data):
+        keyword, _, rest = data.partition(b"\x00")
+        keyword = keyword.decode("latin-1")
+        if chunk_type == b"tEXt":
+            text = rest.decode("latin-1")
+        elif chunk_type == b"zTXt":
+            text = _inflate(rest[1:]).decode("latin-1")
+        else:
+            compressed, rest = rest[0], rest[2:]
+            _, _, rest = rest.partition(b"\x00")  # language
+            _, _, rest = rest.partition(b"\x00")  # translated keyword
+            text = (_inflate(rest) if compressed else rest).decode("utf-8", errors="replace")
+
+        if keyword == "XML:com.adobe.xmp":
+            self._xmp(text)
+        elif keyword in PNG_TEXT:
+            self._set(PNG_TEXT[keyword], text.strip())
+
+    def _tiff(self, data):
+        order = {b"II": "<", b"MM": ">"}.get(bytes(data[:2]))
+        if order is None or struct.unpack(order + "H", data[2:4])[0] != 42:
+            return
+        ifd0 = _read_ifd(data, order, struct.unpack(order + "I", data[4:8])[0])
+
+        for tag, name in IFD0_TAGS.items():
+            if tag in ifd0:
+                self._set_tag(name, _ifd0_value, tag, ifd0[tag])
+
+        if isinstance(ifd0.get(EXIF_IFD_POINTER), int):
+            self._exif(_read_ifd(data, order, ifd0[EXIF_IFD_POINTER]))
+        if isinstance(ifd0.get(GPS_IFD_POINTER), int):
+            self._gps(_read_ifd(data, order, ifd0[GPS_IFD_POINTER]))
+
+    def _exif(self, ifd):
+        for tag, name in EXIF_TAGS.items():
+            if tag in ifd:
+                self._set_tag(name, _exif_value, tag, ifd[tag])
+
+    def _gps(self, ifd):
+        for ref_tag, tag, name in ((1, 2, "GPS Latitude"), (3, 4, "GPS Longitude")):
+            value, ref = ifd.get(tag), _text(ifd.get(ref_tag, b""))
+            if isinstance(value, tuple) and len(value) == 3 and ref in ("N", "S", "E", "W"):
+                self._set(name, format_dms(value[0] + value[1] / 60 + value[2] / 3600, ref))
+        if isinstance(ifd.get(6), float):
+            below = ifd.get(5) in (1, b"\x01")
+            self._set("GPS Altitude", f"{ifd[6]:.1f} m {'Below' if below else 'Above'} Sea Level")
+
+    def _xmp(self, text):
+        for prop, name in XMP_TAGS.items():
+            # properties are either attributes or elements, elements may wrap an rdf:Alt/Seq list
+            match = re.search(rf'\b{prop}="([^"]*)"', text) or re.search(rf"<{prop}>(.*?)</{prop}>", text, re.S)
+            if not match:
+                continue
+            value = html.unescape(re.sub(r"<[^>]+>", " ", match.group(1))).strip()
+            value = " ".join(value.split())
+            if name in ("GPS Latitude", "GPS Longitude"):
+                value = _xmp_coordinate(value)
+            if value:
+                self._set(name, value)
+
+    def _set_tag(self, name, convert, tag, value):
+        # writers put all sorts of types in these, one that doesn't fit is dropped, not the whole header
+        try:
+            value = convert(tag, value)
+        except (ValueError, TypeError, AttributeError, OverflowError, ZeroDivisionError):
+            return
+        if value not in (None, ""):
+            self._set(name, _text(value))
+
+    def _set(self, name, value):
+        # EXIF is read first and wins over XMP and text chunks
+        if value and name not in self.fields:
+            self.fields[name] = value
+
+    def _finish(self):
+        width, height = self.fields.get("Exif Image Width", ""), self.fields.get("Exif Image Height", "")
+        if self._size is None and width.isdigit() and height.isdigit():
+            self._size = (int(width), int(height))
+        if self._size and all(self._size):
+            width, height = self._size
+            self._set("Image Size", f"{width}x{height}")
+            self._set("Megapixels", f"{width * height / 1000000:.1f}")
+        if "GPS Latitude" in self.fields and "GPS Longitude" in self.fields:
+            self._set("GPS Position", f"{self.fields['GPS Latitude']}, {self.fields['GPS Longitude']}")
+
+
+def _ifd0_value(tag, value):
+    if tag >= 0x9C9B:
+        # the XP tags are UTF-16 in a byte array
+        return value.decode("utf-16-le", errors="replace").rstrip("\x00")
+    return value
+
+
+def _exif_value(tag, value):
+    if tag == 0x829A:
+        return _fraction(value)
+    if tag == 0x9201:
+        # APEX value, the exposure is 2^-value seconds
+        return _fraction(2 ** -value) if -64 < value < 64 else None
+    if tag == 0x829D:
+        return f"{value:.1f}"
+    if tag == 0x920A:
+        return f"{value:.1f} mm"
+    if tag == 0x9286:
+        # 8 bytes naming the character set come first
+        charset = value[:8].rstrip(b"\x00 ")
+        return value[8:].decode("utf-16-le" if charset == b"UNICODE" else "utf-8", errors="replace").rstrip("\x00 ")
+    if tag == 0x8827 and isinstance(value, tuple):
+        return value[0]
+    return value
+
+
+def _read_ifd(data, order, offset, max_entries=512):
+    '''tag -> value for one IFD, values past the end of the data are left out'''
+    if offset < 8 or offset + 2 > len(data):
+        return {}
+    count = min(struct.unpack(order + "H", data[offset:offset + 2])[0], max_entries)
+    entries = {}
+    for i in range(count):
+        entry = data[offset + 2 + i * 12:offset + 14 + i * 12]
+        if len(entry) < 12:
+            break
+        tag, field_type, n = struct.unpack(order + "HHI", entry[:8])
+        if field_type not in TIFF_TYPES:
+            continue
+        fmt, unit = TIFF_TYPES[field_type]
+        size = unit * n
+        if size <= 4:
+            raw = entry[8:8 + size]
+        else:
+            start = struct.unpack(order + "I", entry[8:12])[0]
+            raw = data[start:start + size]
+        if len(raw) < size:
+            continue
+
+        if fmt == "s":
+            value = bytes(raw)
+        else:
+            values = struct.unpack(f"{order}{fmt * n}", raw)
+            if field_type in (5, 10):
+                values = tuple(num / den if den else 0.0 for num, den in zip(values[::2], values[1::2]))
+            value = values[0] if n == 1 else values
+        entries[tag] = value
+    return entries
+
+
+def _xmp_coordinate(value):
+    '''XMP writes GPS as "34,3.14N" or "34,3,8.4N", turned into exiftool's format'''
+    match = re.fullmatch(r"(\d+),([\d.]+)(?:,([\d.]+))?([NSEW])", value)
+    if not match:
+        return None
+    degrees, minutes, seconds, ref = match.groups()
+    return format_dms(int(degrees) + float(minutes) / 60 + float(seconds or 0) / 3600, ref)
+
+
+def _inflate(data, max_size=MAX_CHUNK):
+    return zlib.decompressobj().decompress(data, max_size)
+
+
+async def read_metadata(chunks, max_bytes=DEFAULT_MAX_HEADER):
+    '''Feed an async iterator of file chunks to a HeaderParser, stopping the download once it is done'''
+    parser = HeaderParser(max_bytes)
+    async with aclosing(chunks):
+        async for chunk in chunks:
+            if parser.feed(chunk):
+                break
+    parser.close()
+    return parser
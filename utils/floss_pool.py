@@ -0,0 +1,194 @@
+import asyncio
+import json
+import os
+import signal
+import sys
+import tempfile
+
+from utils import metrics
+from utils.attachments import SPOOL_DIR
+from utils.output import DEFAULT_MAX_OUTPUT, ToolResult
+from utils.scheduler import run_tool
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _reserve_output():
+    fd, path = tempfile.mkstemp(prefix="ctfbot-floss-", suffix=".txt", dir=SPOOL_DIR)
+    os.close(fd)
+    return path
+
+
+def _read(path, max_bytes):
+    with open(path, "rb") as f:
+        return f.read(max_bytes)
+
+
+class _WorkerDied(Exception):
+    pass
+
+
+class _Worker:
+    def __init__(self, process):
+        self.process = process
+        self.jobs = 0
+
+    async def call(self, job):
+        try:
+            self.process.stdin.write((json.dumps(job) + "\n").encode())
+            await self.process.stdin.drain()
+            line = await self.process.stdout.readline()
+        except (BrokenPipeError, ConnectionResetError) as e:
+            raise _WorkerDied(str(e)) from None
+        if not line:
+            raise _WorkerDied(f"exited with {await self.process.wait()}")
+        return json.loads(line)
+
+    async def stop(self):
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        await self.process.wait()
+
+
+class FlossPool:
+    '''Keeps floss workers (utils/floss_worker.py) warm so a job doesn't pay for
+    starting floss and importing vivisect every time.
+
+    Workers are recycled after max_jobs jobs or once their RSS goes over
+    max_rss, and killed outright if a job is cancelled mid-run since their state
+    is unknown after that. When floss can't be imported (or every worker died)
+    jobs fall back to running the standalone binary once per job, with the same
+    output either way.
+    '''
+
+    def __init__(self, size=1, max_jobs=50, max_rss=1024 * 1024 * 1024, binary="./tools/floss", python=sys.executable, startup_timeout=120):
+        self.size = size
+        self.max_jobs = max_jobs
+        self.max_rss = max_rss
+        self.binary = binary
+        self.python = python
+        self.startup_timeout = startup_timeout
+        self.available = False
+
+        self._idle = None
+        self._workers = set()
+        self._starting = None
+        self._tasks = set()
+
+    @classmethod
+    def from_config(cls, config, size=1):
+        floss_config = config.get("floss", {})
+        return cls(
+            size=floss_config.get("workers", size),
+            max_jobs=floss_config.get("max_jobs", 50),
+            max_rss=floss_config.get("max_rss_mb", 1024) * 1024 * 1024,
+            binary=floss_config.get("binary", "./tools/floss")
+        )
+
+    def workers(self):
+        return len(self._workers)
+
+    def start(self):
+        '''Spawn the workers in the background, returns the task; safe to call more than once'''
+        if self._starting is None:
+            self._idle = asyncio.Queue()
+            self._starting = asyncio.ensure_future(self._start())
+        return self._starting
+
+    async def _start(self):
+        results = await asyncio.gather(*(self._spawn() for _ in range(self.size)), return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                print(f"floss worker failed to start: {result}")
+            else:
+                self._idle.put_nowait(result)
+        self.available = bool(self._workers)
+        if self.size and not self.available:
+            print(f"no floss workers, running {self.binary} once per job instead")
+
+    async def _spawn(self):
+        process = await asyncio.create_subprocess_exec(
+            self.python, "-m", "utils.floss_worker",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+            start_new_session=True,
+            cwd=ROOT
+        )
+        worker = _Worker(process)
+        try:
+            line = await asyncio.wait_for(process.stdout.readline(), self.startup_timeout)
+            hello = json.loads(line) if line else {"ready": False, "error": "exited during startup"}
+            if not hello["ready"]:
+                raise RuntimeError(hello["error"])
+        except BaseException:
+            await worker.stop()
+            raise
+        self._workers.add(worker)
+        return worker
+
+    def _retire(self, worker, reason):
+        metrics.FLOSS_WORKER_RECYCLES.inc(reason=reason)
+        self._workers.discard(worker)
+        task = asyncio.ensure_future(self._replace(worker))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _replace(self, worker):
+        await worker.stop()
+        try:
+            self._idle.put_nowait(await self._spawn())
+        except Exception as e:
+            print(f"floss worker failed to restart: {e}")
+            if not self._workers:
+                self.available = False
+                # wake anyone still waiting for a worker, they'll fall back to the binary
+                self._idle.put_nowait(None)
+
+    async def run(self, path, limit, max_output=DEFAULT_MAX_OUTPUT):
+        '''floss -n limit path, returns a ToolResult just like run_tool()'''
+        argv = ["-n", str(limit), path]
+        if self.size:
+            await asyncio.shield(self.start())
+        if not self.available:
+            return await run_tool(self.binary, *argv, max_output=max_output)
+
+        worker = await self._idle.get()
+        if worker is None:
+            self._idle.put_nowait(None)
+            return await run_tool(self.binary, *argv, max_output=max_output)
+
+        output = await asyncio.to_thread(_reserve_output)
+        try:
+            try:
+                reply = await worker.call({"argv": argv, "output": output, "max_output": max_output})
+            except _WorkerDied as e:
+                print(f"floss worker died: {e}")
+                self._retire(worker, "died")
+                return await run_tool(self.binary, *argv, max_output=max_output)
+            except BaseException:
+                # cancelled by the scheduler timeout, the worker may still be chewing on it
+                self._retire(worker, "cancelled")
+                raise
+
+            worker.jobs += 1
+            if reply.get("exiting"):
+                self._retire(worker, "output")
+            elif worker.jobs >= self.max_jobs:
+                self._retire(worker, "jobs")
+            elif reply["rss_kb"] * 1024 > self.max_rss:
+                self._retire(worker, "rss")
+            else:
+                self._idle.put_nowait(worker)
+
+            metrics.SUBPROCESS_EXITS.inc(tool="floss-worker", code=reply["returncode"])
+            stdout = await asyncio.to_thread(_read, output, max_output + 1)
+            return ToolResult(reply["returncode"], stdout[:max_output], len(stdout) > max_output)
+        finally:
+            await asyncio.to_thread(os.remove, output)
+
+    async def close(self):
+        workers, self._workers = list(self._workers), set()
+        await asyncio.gather(*(worker.stop() for worker in workers))
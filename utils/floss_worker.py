@@ -0,0 +1,96 @@
+"""
+long-lived floss worker, started by utils.floss_pool as `python -m utils.floss_worker`
+
+imports floss (vivisect, signatures, ...) once and then serves jobs forever:
+one json line per job on stdin {"argv": [...], "output": path, "max_output": n},
+one json line back on stdout {"returncode": n, "rss_kb": n, "exiting": bool}.
+floss's own stdout goes to the job's output file, so the protocol stream never
+sees it, and the file can't grow past max_output + 1 bytes. A job that hits
+that limit leaves output stuck in sys.stdout, so the worker exits after it.
+"""
+import json
+import os
+import resource
+import signal
+import sys
+import traceback
+
+
+def _rss_kb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def _warm_up():
+    import floss.main  # noqa: F401, the expensive part, pulls in vivisect and friends
+
+    # best effort, these exist in recent floss releases and are slow on first use
+    for module in ("floss.render.default", "floss.identify", "floss.string_decoder", "floss.stackstrings", "floss.tightstrings"):
+        try:
+            __import__(module)
+        except ImportError:
+            pass
+
+    return sys.modules["floss.main"]
+
+
+def _run(floss_main, argv, output, max_output, devnull):
+    '''Returns (returncode, clean), clean is False if output was cut off by the size limit'''
+    sys.stdout.flush()
+    soft, hard = resource.getrlimit(resource.RLIMIT_FSIZE)
+    clean = True
+    with open(output, "wb") as out:
+        os.dup2(out.fileno(), 1)
+        # one byte over the cap so the pool can tell the output was cut off
+        resource.setrlimit(resource.RLIMIT_FSIZE, (max_output + 1, hard))
+        try:
+            returncode = floss_main.main(argv) or 0
+        except SystemExit as e:
+            returncode = e.code if isinstance(e.code, int) else 1
+        except Exception:
+            traceback.print_exc()
+            returncode = 1
+        finally:
+            try:
+                sys.stdout.flush()
+            except OSError:
+                clean = False
+            resource.setrlimit(resource.RLIMIT_FSIZE, (soft, hard))
+            os.dup2(devnull, 1)
+    return returncode, clean
+
+
+def main():
+    # keep the real stdout for the protocol, fd 1 is lent to floss one job at a time
+    protocol = os.fdopen(os.dup(1), "w", buffering=1)
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    # going over RLIMIT_FSIZE should fail the write, not kill the worker
+    signal.signal(signal.SIGXFSZ, signal.SIG_IGN)
+
+    try:
+        floss_main = _warm_up()
+    except Exception as e:
+        protocol.write(json.dumps({"ready": False, "error": f"{type(e).__name__}: {e}"}) + "\n")
+        return 1
+
+    protocol.write(json.dumps({"ready": True, "rss_kb": _rss_kb()}) + "\n")
+
+    for line in sys.stdin:
+        job = json.loads(line)
+        returncode, clean = _run(floss_main, job["argv"], job["output"], job["max_output"], devnull)
+        protocol.write(json.dumps({"returncode": returncode, "rss_kb": _rss_kb(), "exiting": not clean}) + "\n")
+        if not clean:
+            break
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
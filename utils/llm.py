@@ -0,0 +1,125 @@
+import asyncio
+import random
+import time
+
+import httpx
+
+from utils import metrics
+
+OPENROUTER_URL = "https://openrouter.ai/api/v1"
+
+HEADERS = {
+    "HTTP-Referer": "https://discord.gg/U9dUVNe6ph",
+    "X-Title": "ctfbot",
+}
+
+
+class LLMClient:
+    '''One long-lived OpenRouter client shared by every AI-backed command.
+
+    Keeps a pool of keep-alive connections, retries transient failures with
+    exponential backoff and caps how many requests are in flight at once.
+    '''
+
+    def __init__(self, api_key, base_url=OPENROUTER_URL, timeout=60, connect_timeout=10, max_retries=3, backoff=1.0, max_concurrency=8):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+        self._api_key = api_key
+        self._base_url = base_url
+        self._http = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+            timeout=httpx.Timeout(timeout, connect=connect_timeout)
+        )
+        self._client = None
+        self._loading = None
+        # worth another try, everything else (bad request, auth, ...) is raised straight away
+        self._retryable = ()
+
+    @classmethod
+    def from_config(cls, config):
+        llm_config = config.get("llm", {})
+        return cls(
+            api_key=config["openrouter_api_key"],
+            base_url=llm_config.get("base_url", OPENROUTER_URL),
+            timeout=llm_config.get("timeout", 60),
+            connect_timeout=llm_config.get("connect_timeout", 10),
+            max_retries=llm_config.get("max_retries", 3),
+            backoff=llm_config.get("backoff", 1.0),
+            max_concurrency=llm_config.get("max_concurrency", 8)
+        )
+
+    def start(self):
+        '''Load openai and create the client in the background, returns the task; safe to call more than once'''
+        if self._loading is None:
+            self._loading = asyncio.ensure_future(self._load())
+        return self._loading
+
+    async def _load(self):
+        # openai takes about half a second to import, most of the bot's startup, so it is
+        # loaded in a thread once the bot is up. the client also imports its resources
+        # on first use, chat.completions is touched here so that doesn't happen on the loop
+        self._client = await asyncio.to_thread(self._create)
+        return self._client
+
+    def _create(self):
+        import openai
+        self._retryable = (openai.APIConnectionError, openai.APITimeoutError, openai.InternalServerError, openai.RateLimitError)
+        client = openai.AsyncOpenAI(
+            base_url=self._base_url,
+            api_key=self._api_key,
+            http_client=self._http,
+            default_headers=HEADERS,
+            max_retries=0  # retries are handled below so they also respect the semaphore
+        )
+        client.chat.completions
+        return client
+
+    async def complete(self, model, messages, **kwargs):
+        client = await asyncio.shield(self.start())
+
+        async def create():
+            async with self._semaphore:
+                with metrics.LLM_SECONDS.time(model=model):
+                    return await client.chat.completions.create(model=model, messages=messages, **kwargs)
+
+        return await self._retry(model, create)
+
+    async def stream(self, model, messages, **kwargs):
+        '''Yield content deltas as they arrive. Only opening the stream is retried, never a half-read one'''
+        client = await asyncio.shield(self.start())
+        async with self._semaphore:
+            start = time.perf_counter()
+            stream = await self._retry(
+                model,
+                lambda: client.chat.completions.create(model=model, messages=messages, stream=True, **kwargs)
+            )
+            try:
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+            except Exception as e:
+                metrics.LLM_ERRORS.inc(model=model, error=type(e).__name__)
+                raise
+            finally:
+                await stream.close()
+                metrics.LLM_SECONDS.observe(time.perf_counter() - start, model=model)
+
+    async def _retry(self, model, create):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await create()
+            except Exception as e:
+                metrics.LLM_ERRORS.inc(model=model, error=type(e).__name__)
+                if not isinstance(e, self._retryable) or attempt == self.max_retries:
+                    raise
+                delay = self.backoff * 2 ** attempt + random.uniform(0, self.backoff)
+                print(f"LLM request to {model} failed ({type(e).__name__}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.close()
+        else:
+            await self._http.aclose()
@@ -0,0 +1,82 @@
+import hashlib
+import json
+import struct
+
+from utils.signatures import SIGNATURES
+
+_END = None  # trie key holding the signatures that end at a node
+
+
+class SignatureIndex:
+    '''Prefix tries over a signature table, one trie per offset.
+
+    Looking up a buffer walks each trie once along the bytes at its offset, so
+    the cost depends on the number of distinct offsets and the signature length,
+    not on how many signatures there are.
+    '''
+
+    def __init__(self, signatures):
+        self._tries = {}
+        self.span = 0  # how many leading bytes a lookup can look at
+
+        for name, parts in signatures:
+            parts = [(offset, bytes.fromhex(hex_bytes)) for offset, hex_bytes in parts]
+            (offset, first), extra = parts[0], parts[1:]
+
+            node = self._tries.setdefault(offset, {})
+            for b in first:
+                node = node.setdefault(b, {})
+            node.setdefault(_END, []).append((name, extra, sum(len(p) for _, p in parts)))
+
+            self.span = max(self.span, *(offset + len(p) for offset, p in parts))
+
+    def match(self, data):
+        '''Return [(name, matched byte count)] for every matching signature, most specific first'''
+        view = data[:self.span]
+        found = {}
+
+        for offset, node in self._tries.items():
+            for b in view[offset:]:
+                node = node.get(b)
+                if node is None:
+                    break
+                for name, extra, score in node.get(_END, ()):
+                    if all(view[o:o + len(p)] == p for o, p in extra):
+                        found[name] = max(found.get(name, 0), score)
+
+        return sorted(found.items(), key=lambda m: m[1], reverse=True)
+
+
+INDEX = SignatureIndex(SIGNATURES)
+# changes whenever a signature is added, edited or reordered, for keying cached answers
+TABLE_HASH = hashlib.sha256(json.dumps(SIGNATURES).encode()).hexdigest()
+
+
+def _refine(name, data):
+    # MZ alone says little, most CTF uploads are actually PE files
+    if name == "DOS MZ executable" and len(data) >= 0x40:
+        pe_offset = struct.unpack_from("<I", data, 0x3C)[0]
+        if data[pe_offset:pe_offset + 4] == b"PE\x00\x00":
+            optional_magic = bytes(data[pe_offset + 24:pe_offset + 26])
+            return {b"\x0b\x01": "PE32 executable (Windows)", b"\x0b\x02": "PE32+ executable (Windows, 64-bit)"}.get(
+                optional_magic, "PE executable (Windows)")
+    return name
+
+
+def identify(data):
+    '''Identify a buffer by its magic bytes.
+
+    Returns (file type, candidates). The file type is None when nothing matched
+    or when the most specific matches disagree; candidates lists the names that
+    were tied in that case.
+    '''
+    matches = INDEX.match(data)
+    if not matches:
+        return None, []
+
+    best = matches[0][1]
+    candidates = [name for name, score in matches if score == best]
+    if len(candidates) > 1:
+        return None, candidates
+
+    return _refine(candidates[0], data), candidates
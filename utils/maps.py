@@ -0,0 +1,145 @@
+import asyncio
+import math
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import httpx
+
+from utils import metrics
+
+GEOAPIFY_URL = "https://maps.geoapify.com/v1/staticmap"
+
+
+class StaticMaps:
+    '''Static map images for /exif, fetched asynchronously and cached on disk.
+
+    Coordinates are rounded to about a pixel at the map's zoom before the map is
+    requested, so every photo taken around the same spot shares one cached image
+    (keyed by zoom and the rounded coordinates), and requests for an image that
+    is already being fetched wait for that fetch instead of starting another.
+    At most max_tiles images are kept, the oldest are deleted first.
+    '''
+
+    def __init__(self, http, api_key, url=GEOAPIFY_URL, zoom=11, width=640, height=360, directory="maps", max_tiles=10000):
+        self.http = http
+        self.api_key = api_key
+        self.url = url
+        self.zoom = zoom
+        self.width = width
+        self.height = height
+        self.directory = directory
+        self.max_tiles = max_tiles
+        # a pixel is 360 / (256 * 2^zoom) degrees wide, keep just enough digits to stay inside one
+        self.digits = max(0, math.ceil(math.log10(256 * 2 ** zoom / 360)))
+
+        self._fetching = {}  # rounded (lat, lon) -> task
+        # paths of the stored images, oldest first. Read from the directory on the first
+        # write and only touched from worker threads, hence the lock
+        self._tiles = None
+        self._tiles_lock = threading.Lock()
+
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, config, http):
+        map_config = config.get("exif", {}).get("map", {})
+        return cls(
+            http,
+            api_key=config.get("geoapify_api_key"),
+            url=map_config.get("url", GEOAPIFY_URL),
+            zoom=map_config.get("zoom", 11),
+            directory=map_config.get("directory", "maps"),
+            max_tiles=map_config.get("max_tiles", 10000)
+        )
+
+    def key(self, lat, lon):
+        return round(lat, self.digits), round(lon, self.digits)
+
+    async def get(self, lat, lon):
+        '''PNG bytes of the map around lat, lon, or None when it couldn't be fetched'''
+        key = self.key(lat, lon)
+        if self.directory:
+            data = await asyncio.to_thread(_read, self._path(key))
+            if data is not None:
+                metrics.MAP_TILES.inc(result="hit")
+                return data
+
+        task = self._fetching.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(key))
+            self._fetching[key] = task
+            task.add_done_callback(lambda _: self._fetching.pop(key, None))
+        else:
+            metrics.MAP_TILES.inc(result="shared")
+        # one caller giving up mustn't cancel the fetch for everyone else waiting on it
+        return await asyncio.shield(task)
+
+    async def _fetch(self, key):
+        lat, lon = key
+        params = {
+            "style": "osm-bright",
+            "width": self.width,
+            "height": self.height,
+            "center": f"lonlat:{lon},{lat}",
+            "zoom": self.zoom,
+            "marker": f"lonlat:{lon},{lat};color:#ff0000;size:small",
+            "scaleFactor": 2,
+            "apiKey": self.api_key,
+        }
+        try:
+            response = await self.http.get(self.url, params=params)
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            metrics.MAP_TILES.inc(result="error")
+            print(f"Failed to fetch map: {e}")
+            return None
+
+        metrics.MAP_TILES.inc(result="fetched")
+        if self.directory:
+            await asyncio.to_thread(self._store, self._path(key), response.content)
+        return response.content
+
+    def _path(self, key):
+        lat, lon = key
+        return os.path.join(self.directory, str(self.zoom), f"{lat}_{lon}.png")
+
+    def _store(self, path, data):
+        _write(path, data)
+        with self._tiles_lock:
+            if self._tiles is None:
+                found = []
+                for root, _, names in os.walk(self.directory):
+                    for name in names:
+                        if name.endswith(".png"):
+                            try:
+                                found.append((os.path.getmtime(os.path.join(root, name)), os.path.join(root, name)))
+                            except FileNotFoundError:
+                                continue
+                self._tiles = OrderedDict((tile, None) for _, tile in sorted(found))
+            self._tiles[path] = None
+            self._tiles.move_to_end(path)
+            while len(self._tiles) > self.max_tiles:
+                old, _ = self._tiles.popitem(last=False)
+                try:
+                    os.remove(old)
+                except FileNotFoundError:
+                    pass
+
+
+def _read(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
@@ -0,0 +1,218 @@
+import functools
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from aiohttp import web
+
+# seconds, from a fast cache hit up to a slow floss run
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def _format_labels(self, key, extra=()):
+        pairs = list(zip(self.label_names, key)) + list(extra)
+        if not pairs:
+            return ""
+        escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+        return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines += self._samples()
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self._values = defaultdict(float)
+
+    def inc(self, amount=1, **labels):
+        self._values[self._key(labels)] += amount
+
+    def value(self, **labels):
+        return self._values[self._key(labels)]
+
+    def total(self, **labels):
+        '''Sum over every label set that matches the given labels'''
+        wanted = {self.label_names.index(name): str(value) for name, value in labels.items()}
+        return sum(v for k, v in self._values.items() if all(k[i] == value for i, value in wanted.items()))
+
+    def _samples(self):
+        return [f"{self.name}{self._format_labels(k)} {v}" for k, v in self._values.items()]
+
+
+class Gauge(_Metric):
+    '''A value that goes up and down, or is read from a callback at scrape time'''
+    kind = "gauge"
+
+    def __init__(self, name, help, labels=(), function=None):
+        super().__init__(name, help, labels)
+        self._values = defaultdict(float)
+        self._function = function  # returns {label tuple: value}
+
+    def set(self, value, **labels):
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        self._values[self._key(labels)] += amount
+
+    def dec(self, amount=1, **labels):
+        self._values[self._key(labels)] -= amount
+
+    def set_function(self, function):
+        self._function = function
+
+    def values(self):
+        if self._function:
+            return {tuple(str(v) for v in k): v for k, v in self._function().items()}
+        return dict(self._values)
+
+    def _samples(self):
+        return [f"{self.name}{self._format_labels(k)} {v}" for k, v in self.values().items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        self._counts = defaultdict(lambda: [0] * (len(self.buckets) + 1))
+        self._sums = defaultdict(float)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        counts = self._counts[key]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+        self._sums[key] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def label_sets(self):
+        return [dict(zip(self.label_names, key)) for key in self._counts]
+
+    def count(self, **labels):
+        return sum(self._counts.get(self._key(labels), ()))
+
+    def quantile(self, q, **labels):
+        '''Estimate a quantile by interpolating inside the bucket it falls in, like histogram_quantile()'''
+        counts = self._counts.get(self._key(labels))
+        if not counts or not sum(counts):
+            return None
+        rank = q * sum(counts)
+        seen = 0
+        for i, count in enumerate(counts):
+            if seen + count >= rank and count:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def _samples(self):
+        lines = []
+        for key, counts in self._counts.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{self._format_labels(key, [('le', str(bound))])} {cumulative}")
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {self._sums[key]}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} {cumulative}")
+        return lines
+
+
+REGISTRY = []
+
+STAGE_SECONDS = Histogram("ctfbot_stage_seconds", "Time spent per command stage (defer, download, tool, llm, followup)", ["command", "stage"])
+COMMAND_SECONDS = Histogram("ctfbot_command_seconds", "End to end command handler time", ["command"])
+COMMANDS = Counter("ctfbot_commands_total", "Commands handled", ["command", "status"])
+COMMAND_ERRORS = Counter("ctfbot_command_errors_total", "Commands that replied with an error", ["command"])
+IN_FLIGHT = Gauge("ctfbot_commands_in_flight", "Command handlers currently running", ["command"])
+JOBS_RUNNING = Gauge("ctfbot_jobs_running", "Scheduler jobs currently running", ["tool"])
+QUEUE_DEPTH = Gauge("ctfbot_queue_depth", "Scheduler jobs waiting for a slot", ["tool"])
+CACHE = Gauge("ctfbot_cache", "Result cache counters (hits per tier, misses, hit rate, size)", ["stat"])
+SUBPROCESS_EXITS = Counter("ctfbot_subprocess_exits_total", "Tool subprocess exit codes", ["tool", "code"])
+FLOSS_WORKERS = Gauge("ctfbot_floss_workers", "Warm floss workers alive")
+FLOSS_WORKER_RECYCLES = Counter("ctfbot_floss_worker_recycles_total", "Floss workers replaced (jobs, rss, output, died, cancelled)", ["reason"])
+INGESTED_BYTES = Counter("ctfbot_ingested_bytes_total", "Attachment bytes downloaded")
+ASK_CACHE = Counter("ctfbot_ask_cache_total", "/ask answers by source (miss, hit, similar, shared)", ["result"])
+LLM_SECONDS = Histogram("ctfbot_llm_seconds", "OpenRouter request latency", ["model"])
+LLM_ERRORS = Counter("ctfbot_llm_errors_total", "OpenRouter request errors", ["model", "error"])
+ROUTER_EVENTS = Counter("ctfbot_router_events_total", "Model router decisions (hedge, failover, fallback_answered, circuit_open)", ["model", "event"])
+MAP_TILES = Counter("ctfbot_map_tiles_total", "/exif map images by source (hit, fetched, shared, error)", ["result"])
+STARTUP_SECONDS = Gauge("ctfbot_startup_seconds", "Seconds from start until each startup phase was done (imports, connected, ready)", ["phase"])
+LOOP_LAG_SECONDS = Histogram("ctfbot_loop_lag_seconds", "How late the event loop watchdog heartbeat woke up")
+LOOP_STALLS = Counter("ctfbot_loop_stalls_total", "Times the event loop was blocked past the watchdog threshold")
+BLOCKING_IO = Counter("ctfbot_blocking_io_total", "File system calls made on the event loop thread (watchdog strict mode)", ["event"])
+
+
+def stage(command, name):
+    return STAGE_SECONDS.time(command=command, stage=name)
+
+
+def instrumented(command):
+    '''Wrap a command handler to track in-flight count, total time and status.
+
+    Goes directly above the handler (below the app_commands decorators) so
+    discord.py still sees the handler's own signature.
+    '''
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            IN_FLIGHT.inc(command=command)
+            status = "ok"
+            try:
+                with COMMAND_SECONDS.time(command=command):
+                    return await func(*args, **kwargs)
+            except BaseException:
+                status = "error"
+                raise
+            finally:
+                IN_FLIGHT.dec(command=command)
+                COMMANDS.inc(command=command, status=status)
+        return wrapper
+    return decorator
+
+
+def render():
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+async def start_server(host="127.0.0.1", port=9108):
+    '''Serve render() on http://host:port/metrics, returns the runner so it can be cleaned up'''
+    async def handle(request):
+        return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
@@ -0,0 +1,159 @@
+import asyncio
+import gzip
+from collections import namedtuple
+from io import BytesIO
+
+import discord
+from discord import ButtonStyle
+from discord.ui import View
+
+# what fits in one message once the code block fences are added
+PAGE_SIZE = 1990
+DEFAULT_MAX_OUTPUT = 8 * 1024 * 1024
+# results bigger than this are uploaded gzipped
+GZIP_THRESHOLD = 1024 * 1024
+
+ToolResult = namedtuple("ToolResult", ["returncode", "stdout", "truncated"])
+
+
+class BoundedBuffer:
+    '''Collects tool output up to max_bytes, everything past that is counted and dropped'''
+
+    def __init__(self, max_bytes=DEFAULT_MAX_OUTPUT):
+        self.max_bytes = max_bytes
+        self.dropped = 0
+        self._buffer = BytesIO()
+
+    @property
+    def truncated(self):
+        return self.dropped > 0
+
+    def write(self, chunk):
+        room = self.max_bytes - self._buffer.tell()
+        self._buffer.write(chunk[:room])
+        self.dropped += max(len(chunk) - room, 0)
+
+    def getvalue(self):
+        return self._buffer.getvalue()
+
+
+def truncation_note(max_bytes):
+    return f"\n[output truncated at {max_bytes} bytes]"
+
+
+def cap(text, max_bytes=DEFAULT_MAX_OUTPUT):
+    '''text cut down to max_bytes of utf-8, with a note if anything was cut'''
+    data = text.encode()
+    if len(data) <= max_bytes:
+        return text
+    return data[:max_bytes].decode(errors="ignore") + truncation_note(max_bytes)
+
+
+class Pages:
+    '''Page boundaries over one string, worked out once so flipping a page is just a slice'''
+
+    def __init__(self, text, size=PAGE_SIZE):
+        self.text = text
+        self.offsets = []
+        start = 0
+        while start < len(text):
+            end = min(start + size, len(text))
+            if end < len(text):
+                cut = text.rfind("\n", start + size // 2, end)
+                if cut != -1:
+                    end = cut + 1
+            self.offsets.append((start, end))
+            start = end
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, index):
+        start, end = self.offsets[index]
+        return self.text[start:end].rstrip("\n")
+
+
+def attachment(text, filename):
+    '''text as a discord.File, gzipped once it is big enough for it to matter
+
+    Compressing megabytes takes a while, so call it through asyncio.to_thread.
+    '''
+    data = text.encode()
+    if len(data) > GZIP_THRESHOLD:
+        return discord.File(BytesIO(gzip.compress(data, compresslevel=6)), filename=f"{filename}.gz")
+    return discord.File(BytesIO(data), filename=filename)
+
+
+class PageView(View):
+    '''Previous/next buttons over Pages, plus a download button for the whole thing'''
+
+    def __init__(self, pages, filename, owner_id, timeout=600):
+        super().__init__(timeout=timeout)
+        self.pages = pages
+        self.filename = filename
+        self.owner_id = owner_id
+        self.index = 0
+        self.message = None
+        self._update()
+
+    def content(self):
+        return f"```\n{self.pages[self.index]}\n```"
+
+    def _update(self):
+        self.previous.disabled = self.index == 0
+        self.next.disabled = self.index == len(self.pages) - 1
+        self.counter.label = f"{self.index + 1}/{len(self.pages)}"
+
+    async def interaction_check(self, interaction):
+        if interaction.user.id != self.owner_id:
+            await interaction.response.send_message("Only the person who ran the command can flip these pages", ephemeral=True)
+            return False
+        return True
+
+    async def _show(self, interaction, index):
+        self.index = index
+        self._update()
+        await interaction.response.edit_message(content=self.content(), view=self)
+
+    @discord.ui.button(label="◀", style=ButtonStyle.secondary)
+    async def previous(self, interaction, button):
+        await self._show(interaction, self.index - 1)
+
+    @discord.ui.button(label="1/1", style=ButtonStyle.secondary, disabled=True)
+    async def counter(self, interaction, button):
+        pass
+
+    @discord.ui.button(label="▶", style=ButtonStyle.secondary)
+    async def next(self, interaction, button):
+        await self._show(interaction, self.index + 1)
+
+    @discord.ui.button(label="Download", style=ButtonStyle.primary)
+    async def download(self, interaction, button):
+        file = await asyncio.to_thread(attachment, self.pages.text, self.filename)
+        await interaction.response.send_message(file=file, ephemeral=True)
+
+    async def on_timeout(self):
+        for item in self.children:
+            item.disabled = True
+        if self.message:
+            try:
+                await self.message.edit(view=self)
+            except discord.HTTPException:
+                pass
+
+
+async def deliver(interaction, send, text, filename, as_file=False):
+    '''Send tool output the way that suits its size.
+
+    Short output goes inline in a code block, longer output gets a PageView so it
+    can be read without downloading, as_file sends it as a file straight away
+    (gzipped once it is large). send is the followup send to use.
+    '''
+    if as_file:
+        return await send(file=await asyncio.to_thread(attachment, text, filename))
+    if len(text) <= PAGE_SIZE:
+        return await send(f"```\n{text}\n```")
+
+    view = PageView(Pages(text), filename, interaction.user.id)
+    view.message = await send(view.content(), view=view, wait=True)
+    return view.message
@@ -0,0 +1,228 @@
+import asyncio
+import time
+from collections import deque
+
+from utils import metrics
+
+
+class EmptyResponse(Exception):
+    pass
+
+
+class _ModelState:
+    def __init__(self, window):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.failures = 0  # in a row
+        self.open_until = 0.0  # circuit is open (model skipped) until then, 0 when closed
+        self.probing = False
+
+
+class ModelRouter:
+    '''Sends /ask requests to the requested model or an equivalent one.
+
+    Keeps a rolling window of latency and outcomes per model. If the model
+    hasn't answered after its p95 latency a hedge request goes to the next
+    fallback and whichever answers first wins. A model that fails
+    failure_threshold times in a row, or more than error_rate of its recent
+    requests, is skipped for `cooldown` seconds, after which one request is let
+    through to see whether it recovered.
+
+    models is the "ask.models" list from config.json:
+    [{"name": ..., "id": ..., "fallbacks": [model id, ...]}]
+    with fallbacks in the order they should be tried.
+    '''
+
+    def __init__(self, llm, models, window=50, min_samples=10, default_hedge_delay=10.0, min_hedge_delay=1.0,
+                 failure_threshold=3, error_rate=0.5, cooldown=60):
+        self.llm = llm
+        self.models = models
+        self.window = window
+        self.min_samples = min_samples
+        self.default_hedge_delay = default_hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.failure_threshold = failure_threshold
+        self.error_rate = error_rate
+        self.cooldown = cooldown
+
+        self.names = {model["id"]: model["name"] for model in models}
+        self.fallbacks = {model["id"]: model.get("fallbacks", []) for model in models}
+        self._states = {}
+
+    @classmethod
+    def from_config(cls, llm, ask_config):
+        router_config = ask_config.get("router", {})
+        return cls(
+            llm, ask_config.get("models", []),
+            window=router_config.get("window", 50),
+            min_samples=router_config.get("min_samples", 10),
+            default_hedge_delay=router_config.get("default_hedge_delay", 10.0),
+            min_hedge_delay=router_config.get("min_hedge_delay", 1.0),
+            failure_threshold=router_config.get("failure_threshold", 3),
+            error_rate=router_config.get("error_rate", 0.5),
+            cooldown=router_config.get("cooldown", 60)
+        )
+
+    def _state(self, model):
+        if model not in self._states:
+            self._states[model] = _ModelState(self.window)
+        return self._states[model]
+
+    def p95(self, model):
+        latencies = sorted(self._state(model).latencies)
+        if len(latencies) < self.min_samples:
+            return None
+        return latencies[int(len(latencies) * 0.95)]
+
+    def errors(self, model):
+        outcomes = self._state(model).outcomes
+        return outcomes.count(False) / len(outcomes) if outcomes else 0.0
+
+    def is_open(self, model):
+        return time.monotonic() < self._state(model).open_until
+
+    def hedge_delay(self, model):
+        p95 = self.p95(model)
+        return self.default_hedge_delay if p95 is None else max(p95, self.min_hedge_delay)
+
+    def snapshot(self):
+        '''{model: (p95, error rate, circuit open)} for every model that has been used'''
+        return {model: (self.p95(model), self.errors(model), self.is_open(model)) for model in self._states}
+
+    def _available(self, model):
+        state = self._state(model)
+        if not state.open_until:
+            return True
+        if time.monotonic() < state.open_until:
+            return False
+        # cooldown is over, let a single request through to probe it
+        return not state.probing
+
+    def candidates(self, model):
+        '''The requested model and its fallbacks, minus the ones with an open circuit'''
+        chain = [model] + [m for m in self.fallbacks.get(model, []) if m != model]
+        return [m for m in chain if self._available(m)] or chain[:1]
+
+    def _succeeded(self, model, latency):
+        state = self._state(model)
+        state.latencies.append(latency)
+        state.outcomes.append(True)
+        state.failures = 0
+        state.open_until = 0.0
+        state.probing = False
+
+    def _failed(self, model):
+        state = self._state(model)
+        state.outcomes.append(False)
+        state.failures += 1
+        tripped = state.failures >= self.failure_threshold or (
+            len(state.outcomes) >= self.min_samples and self.errors(model) >= self.error_rate
+        )
+        if state.probing or tripped:
+            state.open_until = time.monotonic() + self.cooldown
+            state.probing = False
+            metrics.ROUTER_EVENTS.inc(model=model, event="circuit_open")
+            print(f"{model} is failing, skipping it for {self.cooldown}s")
+
+    async def _attempt(self, model, call):
+        state = self._state(model)
+        if state.open_until:
+            state.probing = True
+        start = time.monotonic()
+        try:
+            result = await call(model)
+        except asyncio.CancelledError:
+            # lost the race to a hedge, that says nothing about the model
+            state.probing = False
+            raise
+        except Exception:
+            self._failed(model)
+            raise
+        self._succeeded(model, time.monotonic() - start)
+        return result
+
+    async def _race(self, model, call, discard=None):
+        '''Return (call(m), m) for the first candidate m to succeed, hedging and failing over along the chain.
+
+        await discard(result) cleans up after a call that succeeded at the same time but lost.
+        '''
+        candidates = self.candidates(model)
+        pending = {}
+        errors = []
+        latest = None
+        try:
+            while candidates or pending:
+                if not pending:
+                    if latest is not None:
+                        metrics.ROUTER_EVENTS.inc(model=candidates[0], event="failover")
+                    latest = candidates.pop(0)
+                    pending[asyncio.ensure_future(self._attempt(latest, call))] = latest
+
+                done, _ = await asyncio.wait(
+                    pending,
+                    timeout=self.hedge_delay(latest) if candidates else None,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    metrics.ROUTER_EVENTS.inc(model=candidates[0], event="hedge")
+                    latest = candidates.pop(0)
+                    pending[asyncio.ensure_future(self._attempt(latest, call))] = latest
+                    continue
+
+                for task in done:
+                    used = pending.pop(task)
+                    if task.exception() is None:
+                        if used != model:
+                            metrics.ROUTER_EVENTS.inc(model=used, event="fallback_answered")
+                        return task.result(), used
+                    errors.append(f"{self.names.get(used, used)}: {task.exception()}")
+
+            raise RuntimeError("No model could answer (" + "; ".join(errors) + ")")
+        finally:
+            for task in pending:
+                task.cancel()
+            for result in await asyncio.gather(*pending, return_exceptions=True):
+                if discard and not isinstance(result, BaseException):
+                    await discard(result)
+
+    async def complete(self, model, messages, **kwargs):
+        '''Return (completion, model id that answered)'''
+        async def call(m):
+            completion = await self.llm.complete(m, messages, **kwargs)
+            if not completion or not completion.choices:
+                raise EmptyResponse("No response received from AI")
+            return completion
+
+        return await self._race(model, call)
+
+    async def stream(self, model, messages, **kwargs):
+        '''Return (model id that answered, async iterator of deltas).
+
+        Models race up to their first delta, which is what hedging and latency
+        are measured on. Once a model has started answering it is committed to,
+        a failure after that is raised to the caller.
+        '''
+        async def call(m):
+            deltas = self.llm.stream(m, messages, **kwargs)
+            try:
+                return deltas, await deltas.__anext__()
+            except StopAsyncIteration:
+                raise EmptyResponse("Empty response received from AI") from None
+            except BaseException:
+                await deltas.aclose()
+                raise
+
+        (deltas, first), used = await self._race(model, call, lambda result: result[0].aclose())
+
+        async def rest():
+            try:
+                yield first
+                async for delta in deltas:
+                    yield delta
+            except Exception:
+                self._failed(used)
+                raise
+            finally:
+                await deltas.aclose()
+
+        return used, rest()
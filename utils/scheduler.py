@@ -0,0 +1,187 @@
+import asyncio
+import os
+import signal
+from collections import OrderedDict, defaultdict, deque
+
+from utils import metrics
+from utils.output import DEFAULT_MAX_OUTPUT, BoundedBuffer, ToolResult
+
+
+class QueueFull(Exception):
+    pass
+
+
+class JobScheduler:
+    '''Runs jobs with a concurrency limit per tool.
+
+    Jobs that can't start right away wait in a per-tool queue that is drained
+    round-robin across guilds, then across users inside a guild, so one busy
+    server (or one user spamming uploads) can't starve everyone else. Every job
+    runs under a timeout; cancelling a job kills whatever subprocess it started
+    through run_tool().
+    '''
+
+    def __init__(self, tools=None, default_concurrency=4, default_timeout=120, max_queue=20, max_per_user=3):
+        self.tools = tools or {}
+        self.default_concurrency = default_concurrency
+        self.default_timeout = default_timeout
+        self.max_queue = max_queue
+        self.max_per_user = max_per_user
+
+        self._running = defaultdict(int)
+        self._per_user = defaultdict(int)  # (tool, user) -> queued + running
+        # tool -> guild -> user -> deque of waiting futures
+        self._queues = defaultdict(OrderedDict)
+
+    def concurrency(self, tool):
+        return self.tools.get(tool, {}).get("concurrency", self.default_concurrency)
+
+    def timeout(self, tool):
+        return self.tools.get(tool, {}).get("timeout", self.default_timeout)
+
+    def running(self, tool):
+        return self._running[tool]
+
+    def queued(self, tool):
+        return sum(len(jobs) for users in self._queues[tool].values() for jobs in users.values())
+
+    def snapshot(self):
+        '''{tool: (running, queued)} for every tool that is configured or has been used'''
+        tools = set(self.tools) | set(self._running)
+        return {tool: (self._running[tool], self.queued(tool)) for tool in sorted(tools)}
+
+    async def run(self, tool, user, guild, factory, on_queued=None):
+        '''Await factory() once a slot for `tool` is free; on_queued(position) is awaited if it has to wait'''
+        if self._per_user[(tool, user)] >= self.max_per_user:
+            raise QueueFull(f"You already have {self.max_per_user} {tool} jobs pending, wait for them to finish")
+
+        self._per_user[(tool, user)] += 1
+        try:
+            if self._running[tool] < self.concurrency(tool) and not self.queued(tool):
+                self._running[tool] += 1
+            else:
+                await self._wait_for_slot(tool, user, guild, on_queued)
+
+            try:
+                return await asyncio.wait_for(factory(), self.timeout(tool))
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"{tool} timed out after {self.timeout(tool)}s") from None
+            finally:
+                self._running[tool] -= 1
+                self._dispatch(tool)
+        finally:
+            self._per_user[(tool, user)] -= 1
+            if not self._per_user[(tool, user)]:
+                del self._per_user[(tool, user)]
+
+    async def _wait_for_slot(self, tool, user, guild, on_queued):
+        if self.queued(tool) >= self.max_queue:
+            raise QueueFull(f"The {tool} queue is full, try again later")
+
+        future = asyncio.get_running_loop().create_future()
+        users = self._queues[tool].setdefault(guild, OrderedDict())
+        users.setdefault(user, deque()).append(future)
+
+        try:
+            if on_queued:
+                await on_queued(self.position(tool, future))
+            await future
+        except BaseException:
+            if future.done() and not future.cancelled():
+                # we were handed a slot but won't use it
+                self._running[tool] -= 1
+                self._dispatch(tool)
+            else:
+                future.cancel()
+                self._remove(tool, guild, user, future)
+            raise
+
+    def _order(self, tool):
+        '''Waiting futures in the order _dispatch would start them'''
+        guilds = deque((g, deque((u, deque(jobs)) for u, jobs in users.items())) for g, users in self._queues[tool].items())
+        while guilds:
+            guild, users = guilds.popleft()
+            user, jobs = users.popleft()
+            yield jobs.popleft()
+            if jobs:
+                users.append((user, jobs))
+            if users:
+                guilds.append((guild, users))
+
+    def position(self, tool, future):
+        for i, queued in enumerate(self._order(tool), start=1):
+            if queued is future:
+                return i
+        return 0
+
+    def _dispatch(self, tool):
+        queues = self._queues[tool]
+        while queues and self._running[tool] < self.concurrency(tool):
+            guild, users = next(iter(queues.items()))
+            user, jobs = next(iter(users.items()))
+            future = jobs.popleft()
+
+            # rotate so the next slot goes to someone else
+            if jobs:
+                users.move_to_end(user)
+            else:
+                del users[user]
+            if users:
+                queues.move_to_end(guild)
+            else:
+                del queues[guild]
+
+            if not future.done():
+                self._running[tool] += 1
+                future.set_result(None)
+
+    def _remove(self, tool, guild, user, future):
+        users = self._queues[tool].get(guild)
+        if not users or user not in users:
+            return
+        try:
+            users[user].remove(future)
+        except ValueError:
+            return
+        if not users[user]:
+            del users[user]
+        if not users:
+            del self._queues[tool][guild]
+
+
+async def run_tool(*args, max_output=DEFAULT_MAX_OUTPUT, chunk_size=64 * 1024):
+    '''Run a tool in its own process group and return a ToolResult.
+
+    stdout is read as it is produced into a buffer of at most max_output bytes,
+    and a tool that prints more than that is killed since the rest would be
+    thrown away anyway. If the awaiting task is cancelled (e.g. by the scheduler
+    timeout) the whole process tree is killed instead of being left running in
+    the background.
+    '''
+    process = await asyncio.create_subprocess_exec(
+        *args,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL,
+        start_new_session=True
+    )
+    output = BoundedBuffer(max_output)
+    try:
+        while chunk := await process.stdout.read(chunk_size):
+            output.write(chunk)
+            if output.truncated:
+                _kill(process)
+                break
+        await process.wait()
+    except BaseException:
+        _kill(process)
+        await process.wait()
+        raise
+    metrics.SUBPROCESS_EXITS.inc(tool=os.path.basename(args[0]), code=process.returncode)
+    return ToolResult(process.returncode, output.getvalue(), output.truncated)
+
+
+def _kill(process):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
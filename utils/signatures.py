@@ -0,0 +1,174 @@
+# magic byte signatures used by utils.magic
+# each entry is (file type, [(offset, hex bytes), ...]), every part has to match
+# the first part is what gets indexed, keep the most distinctive bytes there
+
+SIGNATURES = [
+    # images
+    ("PNG image", [(0, "89 50 4E 47 0D 0A 1A 0A")]),
+    ("JPEG image", [(0, "FF D8 FF")]),
+    ("GIF image (87a)", [(0, "47 49 46 38 37 61")]),
+    ("GIF image (89a)", [(0, "47 49 46 38 39 61")]),
+    ("BMP image", [(0, "42 4D"), (6, "00 00 00 00")]),
+    ("TIFF image (little endian)", [(0, "49 49 2A 00")]),
+    ("TIFF image (big endian)", [(0, "4D 4D 00 2A")]),
+    ("BigTIFF image", [(0, "49 49 2B 00")]),
+    ("WebP image", [(0, "52 49 46 46"), (8, "57 45 42 50")]),
+    ("ICO icon", [(0, "00 00 01 00")]),
+    ("CUR cursor", [(0, "00 00 02 00")]),
+    ("Photoshop document (PSD)", [(0, "38 42 50 53")]),
+    ("HEIC image", [(4, "66 74 79 70 68 65 69 63")]),
+    ("HEIF image", [(4, "66 74 79 70 6D 69 66 31")]),
+    ("AVIF image", [(4, "66 74 79 70 61 76 69 66")]),
+    ("JPEG 2000 image", [(0, "00 00 00 0C 6A 50 20 20 0D 0A 87 0A")]),
+    ("JPEG XL image", [(0, "FF 0A")]),
+    ("JPEG XL image (container)", [(0, "00 00 00 0C 4A 58 4C 20 0D 0A 87 0A")]),
+    ("OpenEXR image", [(0, "76 2F 31 01")]),
+    ("QOI image", [(0, "71 6F 69 66")]),
+    ("farbfeld image", [(0, "66 61 72 62 66 65 6C 64")]),
+    ("GIMP XCF image", [(0, "67 69 6D 70 20 78 63 66")]),
+    ("DjVu document", [(0, "41 54 26 54 46 4F 52 4D")]),
+    ("Windows metafile (WMF)", [(0, "D7 CD C6 9A")]),
+    ("DirectDraw surface (DDS)", [(0, "44 44 53 20")]),
+
+    # audio / video
+    ("WAV audio", [(0, "52 49 46 46"), (8, "57 41 56 45")]),
+    ("AVI video", [(0, "52 49 46 46"), (8, "41 56 49 20")]),
+    ("MP3 audio (ID3 tag)", [(0, "49 44 33")]),
+    ("MP3 audio", [(0, "FF FB")]),
+    ("FLAC audio", [(0, "66 4C 61 43")]),
+    ("Ogg container", [(0, "4F 67 67 53")]),
+    ("MIDI audio", [(0, "4D 54 68 64")]),
+    ("AIFF audio", [(0, "46 4F 52 4D"), (8, "41 49 46 46")]),
+    ("Sun AU audio", [(0, "2E 73 6E 64")]),
+    ("MP4 video", [(4, "66 74 79 70 69 73 6F 6D")]),
+    ("MP4 video", [(4, "66 74 79 70 6D 70 34 32")]),
+    ("MP4 video", [(4, "66 74 79 70 6D 70 34 31")]),
+    ("M4A audio", [(4, "66 74 79 70 4D 34 41 20")]),
+    ("QuickTime video", [(4, "66 74 79 70 71 74 20 20")]),
+    ("3GP video", [(4, "66 74 79 70 33 67 70")]),
+    ("Matroska / WebM video", [(0, "1A 45 DF A3")]),
+    ("Flash video (FLV)", [(0, "46 4C 56 01")]),
+    ("ASF / WMV / WMA media", [(0, "30 26 B2 75 8E 66 CF 11")]),
+    ("MPEG program stream", [(0, "00 00 01 BA")]),
+    ("MPEG video", [(0, "00 00 01 B3")]),
+
+    # archives / compression
+    ("ZIP archive", [(0, "50 4B 03 04")]),
+    ("ZIP archive (empty)", [(0, "50 4B 05 06")]),
+    ("ZIP archive (spanned)", [(0, "50 4B 07 08")]),
+    ("Office Open XML document (DOCX/XLSX/PPTX)", [(0, "50 4B 03 04"), (30, "5B 43 6F 6E 74 65 6E 74 5F 54 79 70 65 73 5D 2E 78 6D 6C")]),
+    ("EPUB ebook", [(0, "50 4B 03 04"), (30, "6D 69 6D 65 74 79 70 65 61 70 70 6C 69 63 61 74 69 6F 6E 2F 65 70 75 62 2B 7A 69 70")]),
+    ("OpenDocument file", [(0, "50 4B 03 04"), (30, "6D 69 6D 65 74 79 70 65 61 70 70 6C 69 63 61 74 69 6F 6E 2F 76 6E 64 2E 6F 61 73 69 73")]),
+    ("Java archive (JAR)", [(0, "50 4B 03 04"), (30, "4D 45 54 41 2D 49 4E 46 2F")]),
+    ("RAR archive (v4)", [(0, "52 61 72 21 1A 07 00")]),
+    ("RAR archive (v5)", [(0, "52 61 72 21 1A 07 01 00")]),
+    ("7-Zip archive", [(0, "37 7A BC AF 27 1C")]),
+    ("gzip compressed data", [(0, "1F 8B 08")]),
+    ("bzip2 compressed data", [(0, "42 5A 68")]),
+    ("xz compressed data", [(0, "FD 37 7A 58 5A 00")]),
+    ("Zstandard compressed data", [(0, "28 B5 2F FD")]),
+    ("LZ4 compressed data", [(0, "04 22 4D 18")]),
+    ("lzip compressed data", [(0, "4C 5A 49 50")]),
+    ("Unix compress (.Z) data", [(0, "1F 9D")]),
+    ("tar archive (POSIX)", [(257, "75 73 74 61 72 00 30 30")]),
+    ("tar archive (GNU)", [(257, "75 73 74 61 72 20 20 00")]),
+    ("cpio archive (newc)", [(0, "30 37 30 37 30 31")]),
+    ("cpio archive (odc)", [(0, "30 37 30 37 30 37")]),
+    ("ar archive", [(0, "21 3C 61 72 63 68 3E 0A")]),
+    ("Debian package", [(0, "21 3C 61 72 63 68 3E 0A 64 65 62 69 61 6E 2D 62 69 6E 61 72 79")]),
+    ("RPM package", [(0, "ED AB EE DB")]),
+    ("Microsoft cabinet (CAB)", [(0, "4D 53 43 46")]),
+    ("xar archive", [(0, "78 61 72 21")]),
+    ("Windows imaging (WIM)", [(0, "4D 53 57 49 4D 00 00 00")]),
+
+    # disk images / filesystems
+    ("ISO 9660 disk image", [(0x8001, "43 44 30 30 31")]),
+    ("ISO 9660 disk image", [(0x8801, "43 44 30 30 31")]),
+    ("ISO 9660 disk image", [(0x9001, "43 44 30 30 31")]),
+    ("SquashFS filesystem", [(0, "68 73 71 73")]),
+    ("ext2/3/4 filesystem", [(0x438, "53 EF")]),
+    ("NTFS filesystem", [(3, "4E 54 46 53 20 20 20 20")]),
+    ("FAT32 filesystem", [(0x52, "46 41 54 33 32 20 20 20")]),
+    ("FAT16 filesystem", [(0x36, "46 41 54 31 36 20 20 20")]),
+    ("FAT12 filesystem", [(0x36, "46 41 54 31 32 20 20 20")]),
+    ("BitLocker volume", [(3, "2D 46 56 45 2D 46 53 2D")]),
+    ("LUKS encrypted volume", [(0, "4C 55 4B 53 BA BE")]),
+    ("VMware disk (VMDK)", [(0, "4B 44 4D 56")]),
+    ("QEMU disk (qcow)", [(0, "51 46 49 FB")]),
+    ("Virtual PC disk (VHD)", [(0, "63 6F 6E 65 63 74 69 78")]),
+    ("Hyper-V disk (VHDX)", [(0, "76 68 64 78 66 69 6C 65")]),
+    ("VirtualBox disk (VDI)", [(0, "3C 3C 3C 20 4F 72 61 63 6C 65 20 56 4D 20 56 69 72 74 75 61 6C 42 6F 78")]),
+    ("Android boot image", [(0, "41 4E 44 52 4F 49 44 21")]),
+    ("U-Boot image", [(0, "27 05 19 56")]),
+    ("Flattened device tree (DTB)", [(0, "D0 0D FE ED")]),
+
+    # executables / bytecode
+    ("ELF executable", [(0, "7F 45 4C 46")]),
+    ("DOS MZ executable", [(0, "4D 5A")]),
+    ("Mach-O executable (32-bit)", [(0, "FE ED FA CE")]),
+    ("Mach-O executable (64-bit)", [(0, "FE ED FA CF")]),
+    ("Mach-O executable (32-bit, little endian)", [(0, "CE FA ED FE")]),
+    ("Mach-O executable (64-bit, little endian)", [(0, "CF FA ED FE")]),
+    # same four bytes, the LLM gets to look at the rest
+    ("Java class file", [(0, "CA FE BA BE")]),
+    ("Mach-O universal binary", [(0, "CA FE BA BE")]),
+    ("Dalvik executable (DEX)", [(0, "64 65 78 0A")]),
+    ("WebAssembly binary", [(0, "00 61 73 6D")]),
+    ("Lua bytecode", [(0, "1B 4C 75 61")]),
+    ("LLVM bitcode", [(0, "42 43 C0 DE")]),
+    ("Script (shebang)", [(0, "23 21")]),
+    ("Java serialized object", [(0, "AC ED 00 05")]),
+    ("Python pickle (protocol 4)", [(0, "80 04 95")]),
+    ("Python pickle (protocol 5)", [(0, "80 05 95")]),
+    ("Shockwave Flash (SWF)", [(0, "46 57 53")]),
+    ("Shockwave Flash (SWF, zlib)", [(0, "43 57 53")]),
+    ("Shockwave Flash (SWF, LZMA)", [(0, "5A 57 53")]),
+    ("Chrome extension (CRX)", [(0, "43 72 32 34")]),
+    ("Microsoft program database (PDB)", [(0, "4D 69 63 72 6F 73 6F 66 74 20 43 2F 43 2B 2B 20 4D 53 46 20 37 2E 30 30")]),
+    ("Windows minidump", [(0, "4D 44 4D 50")]),
+
+    # documents / text
+    ("PDF document", [(0, "25 50 44 46")]),
+    ("PostScript document", [(0, "25 21 50 53")]),
+    ("Rich Text Format (RTF)", [(0, "7B 5C 72 74 66")]),
+    ("Microsoft OLE2 compound file (DOC/XLS/PPT/MSI)", [(0, "D0 CF 11 E0 A1 B1 1A E1")]),
+    ("Microsoft Access database", [(0, "00 01 00 00 53 74 61 6E 64 61 72 64 20 4A 65 74 20 44 42")]),
+    ("Outlook data file (PST)", [(0, "21 42 44 4E")]),
+    ("Compiled HTML help (CHM)", [(0, "49 54 53 46")]),
+    ("XML document", [(0, "3C 3F 78 6D 6C")]),
+    ("HTML document", [(0, "3C 21 44 4F 43 54 59 50 45 20 68 74 6D 6C")]),
+    ("HTML document", [(0, "3C 21 44 4F 43 54 59 50 45 20 48 54 4D 4C")]),
+    ("HTML document", [(0, "3C 68 74 6D 6C")]),
+    ("UTF-8 text (with BOM)", [(0, "EF BB BF")]),
+    ("UTF-16 text (little endian BOM)", [(0, "FF FE")]),
+    ("UTF-16 text (big endian BOM)", [(0, "FE FF")]),
+    ("UTF-32 text (little endian BOM)", [(0, "FF FE 00 00")]),
+    ("PEM encoded data", [(0, "2D 2D 2D 2D 2D 42 45 47 49 4E")]),
+    ("Windows shortcut (LNK)", [(0, "4C 00 00 00 01 14 02 00 00 00 00 00 C0 00 00 00 00 00 00 46")]),
+    ("Windows registry hive", [(0, "72 65 67 66")]),
+    ("Windows event log (EVTX)", [(0, "45 6C 66 46 69 6C 65 00")]),
+    ("BitTorrent file", [(0, "64 38 3A 61 6E 6E 6F 75 6E 63 65")]),
+    ("Apple binary property list", [(0, "62 70 6C 69 73 74 30 30")]),
+
+    # data / databases / captures
+    ("SQLite database", [(0, "53 51 4C 69 74 65 20 66 6F 72 6D 61 74 20 33 00")]),
+    ("pcap capture (little endian)", [(0, "D4 C3 B2 A1")]),
+    ("pcap capture (big endian)", [(0, "A1 B2 C3 D4")]),
+    ("pcap capture (nanosecond, little endian)", [(0, "4D 3C B2 A1")]),
+    ("pcap capture (nanosecond, big endian)", [(0, "A1 B2 3C 4D")]),
+    ("pcapng capture", [(0, "0A 0D 0D 0A")]),
+    ("KeePass database (KDBX)", [(0, "03 D9 A2 9A 67 FB 4B B5")]),
+    ("KeePass database (KDB)", [(0, "03 D9 A2 9A 65 FB 4B B5")]),
+    ("HDF5 data", [(0, "89 48 44 46 0D 0A 1A 0A")]),
+    ("NumPy array (NPY)", [(0, "93 4E 55 4D 50 59")]),
+    ("Apache Parquet", [(0, "50 41 52 31")]),
+    ("Git packfile", [(0, "50 41 43 4B")]),
+    ("Git index", [(0, "44 49 52 43")]),
+    ("Blender file", [(0, "42 4C 45 4E 44 45 52")]),
+
+    # fonts
+    ("TrueType font", [(0, "00 01 00 00 00")]),
+    ("OpenType font", [(0, "4F 54 54 4F")]),
+    ("WOFF font", [(0, "77 4F 46 46")]),
+    ("WOFF2 font", [(0, "77 4F 46 32")]),
+]
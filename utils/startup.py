@@ -0,0 +1,47 @@
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+
+
+def tree_hash(tree):
+    '''SHA-256 of the payload tree.sync() would upload, independent of command order'''
+    payload = sorted((command.to_dict(tree) for command in tree.get_commands()), key=lambda command: (command["type"], command["name"]))
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+async def sync_if_changed(tree, path, force=False):
+    '''tree.sync(), but only when the commands changed since the last sync recorded in path.
+
+    Syncing pushes every command to discord and is rate limited, so restarts that
+    didn't touch the commands skip it. The hash is kept per application id, so
+    switching bot tokens still syncs. Returns True when it synced.
+    '''
+    application_id = str(tree.client.application_id)
+    digest = tree_hash(tree)
+    synced = await asyncio.to_thread(_load, path)
+    if not force and synced.get(application_id) == digest:
+        return False
+
+    await tree.sync()
+    synced[application_id] = digest
+    await asyncio.to_thread(_save, path, synced)
+    return True
+
+
+def _load(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _save(path, synced):
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(synced, f, indent=4)
+    os.replace(tmp, path)
@@ -0,0 +1,125 @@
+import asyncio
+import time
+from io import BytesIO
+
+import discord
+
+EMBED_LIMIT = 4096
+
+
+def _read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def split_pages(text, limit=EMBED_LIMIT):
+    '''Split text into embed-sized pages, preferring to break on a newline'''
+    pages = []
+    while len(text) > limit:
+        cut = text.rfind("\n", limit // 2, limit)
+        if cut == -1:
+            cut = limit
+        pages.append(text[:cut])
+        text = text[cut:].lstrip("\n")
+    pages.append(text)
+    return pages
+
+
+class StreamedEmbed:
+    '''Shows a growing answer as followup embeds.
+
+    The first chunk is sent straight away, after that the messages are edited at
+    most once every `interval` seconds to stay clear of discord's rate limits.
+    Text past 4096 characters spills into extra messages, and once more than
+    `max_messages` would be needed the full answer is attached as a file instead.
+    '''
+
+    def __init__(self, interaction, title, footer, thumbnail=None, interval=1.0, max_messages=3, filename="answer.md"):
+        self.interaction = interaction
+        self.title = title
+        self.footer = footer
+        self.thumbnail = thumbnail
+        self.interval = interval
+        self.max_messages = max_messages
+        self.filename = filename
+
+        self.text = ""
+        self.overflowed = False
+        self.first_visible = None  # seconds until the first token was on screen
+
+        self._started = time.perf_counter()
+        self._last_flush = 0
+        self._messages = []
+        self._shown = []
+
+    async def feed(self, delta):
+        self.text += delta
+        if not self._messages or time.perf_counter() - self._last_flush >= self.interval:
+            await self._flush(final=False)
+
+    async def finish(self):
+        if not self.text.strip():
+            raise ValueError("Empty response received from AI")
+
+        await self._flush(final=True)
+
+        if self.overflowed:
+            await self.interaction.followup.send(
+                "Answer too long, full answer attached",
+                file=discord.File(BytesIO(self.text.encode()), filename=self.filename)
+            )
+
+    async def _flush(self, final):
+        if self.overflowed or not self.text.strip():
+            return
+        self._last_flush = time.perf_counter()
+
+        # leave room for the cursor
+        pages = split_pages(self.text, EMBED_LIMIT - 2)
+        if len(pages) > self.max_messages:
+            # stop updating here, finish() attaches the whole thing
+            self.overflowed = True
+            pages = pages[:self.max_messages]
+            final = True
+
+        for i, page in enumerate(pages):
+            last = i == len(pages) - 1
+            state = (page, not final and last, final and last)
+            if i < len(self._shown) and self._shown[i] == state:
+                continue
+
+            embed = self._embed(i, page, *state[1:])
+            if i < len(self._messages):
+                await self._messages[i].edit(embed=embed)
+            else:
+                await self._send(i, embed)
+                self._shown.append(None)
+            self._shown[i] = state
+
+    async def _send(self, index, embed):
+        kwargs = {}
+        if index == 0 and self.thumbnail:
+            try:
+                data = await asyncio.to_thread(_read_file, self.thumbnail)
+                kwargs["file"] = discord.File(BytesIO(data), filename="model.png")
+            except Exception as e:
+                print(f"Failed to load thumbnail: {e}")
+                # Continue without thumbnail if it fails
+                self.thumbnail = None
+                embed.set_thumbnail(url=None)
+
+        self._messages.append(await self.interaction.followup.send(embed=embed, wait=True, **kwargs))
+        if self.first_visible is None:
+            self.first_visible = time.perf_counter() - self._started
+
+    def _embed(self, index, page, cursor, footer):
+        embed = discord.Embed(
+            title=self.title if index == 0 else f"{self.title} (continued)",
+            description=page + " ▌" if cursor else page,
+            color=discord.Color.blue()
+        )
+        if index == 0 and self.thumbnail:
+            embed.set_thumbnail(url="attachment://model.png")
+        if footer:
+            embed.set_footer(text=self.footer + (" (truncated, full answer attached)" if self.overflowed else ""))
+        return embed
@@ -0,0 +1,106 @@
+import asyncio
+import mmap
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+# printable ascii + tab, same set gnu strings uses by default
+_PRINTABLE = rb"[\x20-\x7e\t]"
+
+ENCODINGS = {
+    "ascii": (_PRINTABLE + rb"{%d,}", "ascii"),
+    "utf-16le": (rb"(?:" + _PRINTABLE + rb"\x00){%d,}", "utf-16-le"),
+    "utf-16be": (rb"(?:\x00" + _PRINTABLE + rb"){%d,}", "utf-16-be"),
+}
+
+CHUNK_SIZE = 1 << 20
+
+_patterns = {}
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="strings")
+
+
+def _pattern(encoding, min_len):
+    key = (encoding, min_len)
+    if key not in _patterns:
+        _patterns[key] = re.compile(ENCODINGS[encoding][0] % min_len)
+    return _patterns[key]
+
+
+def _scan(view, encoding, min_len, limit, chunk_size):
+    '''Yield (offset, string) for one encoding, scanning the buffer chunk by chunk'''
+    pattern = _pattern(encoding, min_len)
+    codec = ENCODINGS[encoding][1]
+    unit = 1 if encoding == "ascii" else 2
+    size = len(view)
+    pos = 0
+    endpos = min(chunk_size, size)
+    found = 0
+
+    while pos < size:
+        carry = None
+        resume = pos
+        for match in pattern.finditer(view, pos, endpos):
+            # a run reaching the end of the window (or a UTF-16 char cut in half by it)
+            # may continue in the next chunk
+            if match.end() > endpos - unit and endpos < size:
+                carry = match.start()
+                break
+            yield match.start(), match.group().decode(codec)
+            found += 1
+            if found >= limit:
+                return
+            resume = match.end()
+
+        if carry is not None:
+            pos = carry
+        else:
+            # a run too short to match yet may start just before the end of the window,
+            # back up far enough to see all of it but not into a string already yielded
+            pos = max(endpos - (min_len + 1) * unit, resume) if endpos < size else endpos
+        endpos = min(endpos + chunk_size, size)
+
+
+def extract_strings(data, min_len=4, limit=None, encoding="ascii", chunk_size=CHUNK_SIZE):
+    '''Return up to `limit` strings of at least `min_len` chars, in file order.
+
+    `encoding` is one of ENCODINGS or "all". Scanning stops as soon as enough
+    strings have been found, so large files are only read as far as needed.
+    '''
+    view = data if isinstance(data, memoryview) else memoryview(data)
+    limit = limit if limit is not None else len(view)
+    encodings = list(ENCODINGS) if encoding == "all" else [encoding]
+
+    for name in encodings:
+        if name not in ENCODINGS:
+            raise ValueError(f"Unknown encoding: {name}")
+
+    results = []
+    for name in encodings:
+        results.extend(_scan(view, name, min_len, limit, chunk_size))
+
+    # each encoding already stopped at `limit`, so the first `limit` overall are in here
+    if len(encodings) > 1:
+        results.sort(key=lambda r: r[0])
+
+    return [s for _, s in results[:limit]]
+
+
+def extract_strings_file(path, min_len=4, limit=None, encoding="ascii"):
+    '''extract_strings on a file, mapped rather than read so only the scanned part is touched'''
+    if not os.path.getsize(path):
+        return []
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        return extract_strings(mapped, min_len, limit, encoding)
+
+
+async def extract_strings_async(data, min_len=4, limit=None, encoding="ascii"):
+    '''Run extract_strings on the thread pool.
+
+    The regex holds the GIL while it scans a window, so the event loop still
+    stalls on big inputs, main.py scans in worker processes unless told not to.
+    '''
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _executor,
+        lambda: extract_strings(data, min_len, limit, encoding)
+    )
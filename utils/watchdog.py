@@ -0,0 +1,102 @@
+import asyncio
+import sys
+import threading
+import time
+import traceback
+
+from utils import metrics
+
+# file system audit events that shouldn't happen on the event loop thread
+FILE_EVENTS = {"open", "os.remove", "os.rename", "os.replace", "os.mkdir", "os.listdir", "os.scandir", "shutil.rmtree"}
+
+
+class LoopWatchdog:
+    '''Measures event loop lag and reports what the loop was doing when it stalled.
+
+    A heartbeat task on the loop records how late each of its wakeups is into
+    ctfbot_loop_lag_seconds. A separate thread watches the heartbeat, and once
+    it is more than `threshold` seconds overdue it logs the loop thread's stack,
+    which points straight at the blocking callback.
+
+    In strict mode an audit hook also reports file system calls made on the
+    loop thread, once per call site, so new blocking I/O is caught when it is
+    introduced rather than when a disk is slow.
+    '''
+
+    def __init__(self, threshold=0.1, interval=0.05, strict=False, stack_depth=12):
+        self.threshold = threshold
+        self.interval = interval
+        self.strict = strict
+        self.stack_depth = stack_depth
+
+        self.loop = None
+        self._loop_thread = None
+        self._beat = None
+        self._task = None
+        self._reported = set()
+        self._reporting = False
+
+    @classmethod
+    def from_config(cls, config):
+        watchdog_config = config.get("watchdog", {})
+        return cls(
+            threshold=watchdog_config.get("threshold_ms", 100) / 1000,
+            interval=watchdog_config.get("interval_ms", 50) / 1000,
+            strict=watchdog_config.get("strict", False)
+        )
+
+    def start(self):
+        '''Start watching the running loop, safe to call more than once'''
+        if self._task is not None:
+            return
+        self.loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._task = self.loop.create_task(self._heartbeat())
+        threading.Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+        if self.strict:
+            # audit hooks can't be removed again, so this stays for the life of the process
+            sys.addaudithook(self._audit)
+
+    async def _heartbeat(self):
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self._beat = time.monotonic()
+            metrics.LOOP_LAG_SECONDS.observe(max(self._beat - start - self.interval, 0))
+
+    def _watch(self):
+        stalled_since = None
+        while not self.loop.is_closed():
+            time.sleep(self.interval)
+            overdue = time.monotonic() - self._beat - self.interval
+            if overdue > self.threshold and stalled_since is None:
+                stalled_since = self._beat
+                frame = sys._current_frames().get(self._loop_thread)
+                stack = "".join(traceback.format_stack(frame, limit=self.stack_depth)) if frame else "  (no frame)\n"
+                metrics.LOOP_STALLS.inc()
+                print(f"event loop blocked for over {overdue * 1000:.0f}ms, it is currently in:\n{stack}", end="")
+            elif stalled_since is not None and self._beat != stalled_since:
+                print(f"event loop unblocked after {(self._beat - stalled_since - self.interval) * 1000:.0f}ms")
+                stalled_since = None
+
+    def _audit(self, event, args):
+        if event not in FILE_EVENTS or threading.get_ident() != self._loop_thread or self._reporting:
+            return
+        # a file descriptor being wrapped (os.fdopen, sockets) isn't file system access
+        if event == "open" and not isinstance(args[0], (str, bytes)):
+            return
+
+        frame = sys._getframe(1)
+        site = (event, frame.f_code.co_filename, frame.f_lineno)
+        metrics.BLOCKING_IO.inc(event=event)
+        if site in self._reported:
+            return
+        self._reported.add(site)
+        # formatting the stack reads source files through linecache, which would land back here
+        self._reporting = True
+        try:
+            stack = "".join(traceback.format_stack(frame, limit=self.stack_depth))
+        finally:
+            self._reporting = False
+        print(f"blocking {event} {args[0]!r} on the event loop:\n{stack}", end="")
@@ -0,0 +1,46 @@
+import asyncio
+import functools
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+_pool = None
+
+
+def _ready():
+    return os.getpid()
+
+
+def start(processes=None):
+    '''Start the analysis process pool, processes=None means one per core.
+
+    Call this before the event loop and its threads exist: the pool forks, and
+    with the fork start method every worker is created up front, right here.
+    '''
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=processes or os.cpu_count(), mp_context=multiprocessing.get_context("fork"))
+        _pool.submit(_ready).result()
+    return _pool
+
+
+def started():
+    return _pool is not None
+
+
+async def run(func, *args, **kwargs):
+    '''func(*args, **kwargs) in a worker process if the pool is running, otherwise in a thread.
+
+    func and its arguments have to be picklable, so pass paths (see Upload.path)
+    rather than large buffers.
+    '''
+    if _pool is None:
+        return await asyncio.to_thread(func, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(_pool, functools.partial(func, *args, **kwargs))
+
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None